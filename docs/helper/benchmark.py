@@ -0,0 +1,998 @@
+#!/usr/bin/env python3
+"""
+画像ヘルパーのベンチマーク
+
+用途: image_processor.py・placeholder_generator.py の性能の計測と退行の検出
+- suite: 決定的な合成画像（大きなJPEG、透過PNG、パレットGIF、小さなアイコン）を生成し、
+  process_directory・process_config_file・process_batch の処理速度・レイテンシ・ピークメモリをJSONで出力
+  保存した結果（ベースライン）と比較して退行を検出
+- fonts: プレースホルダーのフォントのキャッシュの効果を計測（フォントの取得のみと一括生成）
+- draft: 縮小デコード（--reducing-gap）の効果を計測
+- pipeline: 逐次処理・並列処理・--pipeline の処理速度を比較
+- server: image_server.py に負荷をかけ、リクエスト/秒・レイテンシ・キャッシュヒット率を計測
+
+使用例:
+    # 全ケースを計測して結果を保存
+    python benchmark.py suite --json baseline.json
+
+    # 変更後に計測し、ベースラインと比較（10%以上の悪化で終了コード1）
+    python benchmark.py suite --baseline baseline.json
+
+    # 縮小デコードの効果を計測（4000x3000 を8枚、全画素処理と reducing_gap=1.5,2,4 を比較）
+    python benchmark.py draft --count 8 --size 4000x3000 --gaps 0,1.5,2,4
+
+    # 遅いストレージ上の画像で、逐次処理と --pipeline の処理速度を比較
+    python benchmark.py pipeline --input //nas/photos --jobs 4
+
+    # 画像変換サーバーの負荷試験（./images の画像に2000リクエスト、同時接続16）
+    python benchmark.py server --input ./images --requests 2000 --concurrency 16
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+import image_processor
+import image_server
+import placeholder_generator
+from image_processor import peak_rss_mb, percentile
+
+# suite で計測するケース
+SUITE_CASES = ("directory", "config", "placeholder")
+# ベースラインとの比較に使う指標と、値が大きいほど良いか
+COMPARE_METRICS = {
+    "images_per_second": True,
+    "megapixels_per_second": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "peak_rss_mb": False,
+}
+# プレースホルダーのサイズ（ヒーロー、カード、サムネイル、バナー、アイコン）
+PLACEHOLDER_SIZES = ("1920x1080", "800x600", "400x300", "1200x400", "64x64")
+# server でキャッシュから返したとみなす X-Cache の値
+SERVER_HIT_STATES = ("memory", "disk", "coalesced", "revalidated")
+
+
+def make_photo(width: int, height: int, seed: int) -> Image.Image:
+    """写真に近いエントロピーを持つ決定的な合成画像を生成"""
+    rng = random.Random(seed)
+
+    # 低解像度のランダム画像を拡大して大まかな濃淡を作る
+    base_size = (max(1, width // 64), max(1, height // 64))
+    base = Image.frombytes("RGB", base_size, rng.randbytes(base_size[0] * base_size[1] * 3))
+    base = base.resize((width, height), Image.Resampling.BICUBIC)
+
+    # 細かいノイズを重ねてディテールを作る
+    noise = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    return Image.blend(base, noise, 0.15)
+
+
+def make_jpeg_corpus(output_dir: Path, count: int, size: tuple[int, int]) -> list[Path]:
+    """ベンチマーク用の大きなJPEGを生成"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+
+    for i in range(count):
+        path = output_dir / f"large-{i:02d}.jpg"
+        make_photo(*size, seed=i).save(path, "JPEG", quality=92)
+        paths.append(path)
+
+    return paths
+
+
+def make_alpha_png(width: int, height: int, seed: int) -> Image.Image:
+    """中央から外側へ透明になる決定的な透過画像を生成"""
+    img = make_photo(width, height, seed).convert("RGBA")
+
+    # 小さな放射状グラデーションを拡大してアルファにする
+    mask = Image.radial_gradient("L").resize((width, height), Image.Resampling.BILINEAR)
+    img.putalpha(mask.point(lambda value: 255 - value))
+    return img
+
+
+def make_icon(size: int, seed: int) -> Image.Image:
+    """数色だけの小さなアイコン画像を生成"""
+    rng = random.Random(seed)
+    img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+
+    # 4x4 のセルを数色で塗り分ける
+    cell = max(1, size // 4)
+    colors = [tuple(rng.randrange(256) for _ in range(3)) + (255,) for _ in range(3)]
+    for y in range(0, size, cell):
+        for x in range(0, size, cell):
+            if rng.random() < 0.7:
+                img.paste(rng.choice(colors), (x, y, x + cell, y + cell))
+    return img
+
+
+def make_suite_corpus(
+    output_dir: Path,
+    jpegs: int,
+    jpeg_size: tuple[int, int],
+    pngs: int,
+    gifs: int,
+    icons: int
+) -> list[dict]:
+    """
+    suite 用の合成画像を生成
+
+    Returns:
+        生成した画像ごとの {"name", "kind", "width", "height"}
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    kinds = [
+        # (種類, 枚数, サイズ, 生成・保存)
+        ("jpeg", jpegs, jpeg_size, lambda img, path: img.save(path, "JPEG", quality=92)),
+        ("png", pngs, (1600, 1200), lambda img, path: img.save(path, "PNG")),
+        ("gif", gifs, (800, 600), lambda img, path: img.quantize(64).save(path, "GIF")),
+        ("icon", icons, (64, 64), lambda img, path: img.save(path, "PNG")),
+    ]
+    suffixes = {"jpeg": ".jpg", "png": ".png", "gif": ".gif", "icon": ".png"}
+    corpus = []
+
+    for kind, count, size, save in kinds:
+        for i in range(count):
+            if kind == "png":
+                img = make_alpha_png(*size, seed=1000 + i)
+            elif kind == "icon":
+                img = make_icon(size[0], seed=3000 + i)
+            else:
+                img = make_photo(*size, seed=(2000 if kind == "gif" else 0) + i)
+
+            name = f"{kind}-{i:02d}{suffixes[kind]}"
+            save(img, output_dir / name)
+            corpus.append({"name": name, "kind": kind, "width": size[0], "height": size[1]})
+
+    return corpus
+
+
+def write_suite_config(corpus: list[dict], path: Path, settings: dict) -> None:
+    """コーパス全体をリネームして処理する image_processor 用の設定ファイルを作成"""
+    config = {
+        "images": [
+            {"input": item["name"], "output": f"renamed-{Path(item['name']).stem}.webp"}
+            for item in corpus
+        ],
+        "default": {"max_width": settings["max_width"], "quality": settings["quality"]},
+    }
+    path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+
+def placeholder_batch(count: int) -> str:
+    """PLACEHOLDER_SIZES を順に使った process_batch 用のバッチ文字列を作成"""
+    return ",".join(
+        f"placeholder-{i:03d}:{PLACEHOLDER_SIZES[i % len(PLACEHOLDER_SIZES)]}"
+        for i in range(count)
+    )
+
+
+def summarize_case(images: int, megapixels: float, seconds: float, latencies: list[float], peak: Optional[float]) -> dict:
+    """1ケースの計測値をまとめる"""
+    return {
+        "images": images,
+        "megapixels": round(megapixels, 2),
+        "seconds": round(seconds, 3),
+        "images_per_second": round(images / seconds, 2),
+        "megapixels_per_second": round(megapixels / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+    }
+
+
+def _run_suite_case(case: str, corpus: list[dict], work_dir: Path, settings: dict) -> dict:
+    """
+    子プロセス内で1ケースを実行して計測
+
+    画像ごとのレイテンシは image_processor では --profile の合計時間、
+    プレースホルダーでは generate_placeholder の呼び出し時間を使う
+    （プレースホルダーを並列生成する場合はワーカー内の呼び出しを測れないため計測しない）。
+    """
+    images_dir = work_dir / "corpus"
+    output_dir = work_dir / f"out-{case}-{os.getpid()}"
+    pixels = {item["name"]: item["width"] * item["height"] / 1_000_000 for item in corpus}
+    latencies = []
+    peaks = []
+
+    start = time.perf_counter()
+
+    if case == "placeholder":
+        original = placeholder_generator.generate_placeholder
+
+        def timed(*args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - began)
+
+        # 1件ごとの時間を測るため、process_batch から呼ばれる関数を差し替える
+        placeholder_generator.generate_placeholder = timed
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                images = placeholder_generator.process_batch(
+                    placeholder_batch(settings["placeholders"]),
+                    output_dir,
+                    settings["placeholder_ext"],
+                    jobs=settings["jobs"]
+                )
+        finally:
+            placeholder_generator.generate_placeholder = original
+
+        megapixels = sum(
+            width * height / 1_000_000
+            for width, height in (
+                placeholder_generator.parse_size(PLACEHOLDER_SIZES[i % len(PLACEHOLDER_SIZES)])
+                for i in range(images)
+            )
+        )
+    else:
+        if case == "directory":
+            results = image_processor.process_directory(
+                images_dir,
+                output_dir,
+                max_width=settings["max_width"],
+                quality=settings["quality"],
+                jobs=settings["jobs"],
+                formats=settings["formats"],
+                profile=True
+            )
+        else:
+            results = image_processor.process_config_file(
+                work_dir / "suite.json",
+                images_dir,
+                output_dir,
+                jobs=settings["jobs"],
+                formats=settings["formats"],
+                profile=True
+            )
+
+        images = 0
+        megapixels = 0.0
+        for result in results:
+            if not result["success"]:
+                raise RuntimeError(f"{result['input']}: {', '.join(result['action'])}")
+            images += 1
+            megapixels += pixels[Path(result["input"]).name]
+            latencies.append(result["profile"]["total"])
+            peaks.append(result["profile"]["peak_rss_mb"])
+
+    elapsed = time.perf_counter() - start
+
+    # 逐次処理では画像ごとにピークをリセットするため、画像ごとのピークの最大も含める
+    peaks = [peak for peak in peaks + [peak_rss_mb()] if peak is not None]
+    return summarize_case(images, megapixels, elapsed, latencies, max(peaks) if peaks else None)
+
+
+def bench_suite(
+    corpus: list[dict],
+    work_dir: Path,
+    cases: list[str],
+    settings: dict,
+    repeat: int = 1
+) -> dict:
+    """
+    ケースごとに repeat 回ずつ新しいプロセスで実行し、処理時間が中央値の回の結果を返す
+
+    ワーカーのピークメモリは並列数によらず1プロセスあたりの最大値。
+    """
+    results = {}
+    context = get_context("spawn")
+
+    for case in cases:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(_run_suite_case, case, corpus, work_dir, settings).result())
+
+        runs.sort(key=lambda run: run["seconds"])
+        results[case] = {**runs[(len(runs) - 1) // 2], "runs": [run["seconds"] for run in runs]}
+
+    return results
+
+
+def environment_info() -> dict:
+    """比較の参考にする実行環境の情報"""
+    return {
+        "python": platform.python_version(),
+        "pillow": Image.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_suite_results(results: dict) -> None:
+    """suite の計測結果を表形式で表示"""
+    # 全角の見出しは表示幅が2倍になるため、その分だけ幅を詰める
+    print(f"{'ケース':<9} {'枚数':>4} {'秒':>7} {'枚/秒':>8} {'MP/秒':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'ピークRSS(MB)':>11}")
+    for case, result in results.items():
+        cells = [
+            f"{result[key]:>9.1f}" if result[key] is not None else f"{'-':>9}"
+            for key in ("p50_ms", "p95_ms")
+        ]
+        rss = f"{result['peak_rss_mb']:>14.0f}" if result["peak_rss_mb"] is not None else f"{'-':>14}"
+        print(
+            f"{case:<12} {result['images']:>6} {result['seconds']:>8.3f}"
+            f" {result['images_per_second']:>10.2f} {result['megapixels_per_second']:>9.2f}"
+            f" {cells[0]} {cells[1]} {rss}"
+        )
+
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> list[dict]:
+    """
+    ベースラインと比較し、指標ごとの変化率を返す
+
+    悪化が threshold（%）を超えた指標は "regression" が True になる。
+    """
+    rows = []
+
+    for case, result in results.items():
+        base = baseline.get(case)
+        if not base:
+            continue
+
+        for metric, higher_is_better in COMPARE_METRICS.items():
+            current, previous = result.get(metric), base.get(metric)
+            if current is None or not previous:
+                continue
+
+            change = (current - previous) / previous * 100
+            worse = -change if higher_is_better else change
+            rows.append({
+                "case": case,
+                "metric": metric,
+                "baseline": previous,
+                "current": current,
+                "change_percent": round(change, 1),
+                "regression": worse > threshold,
+            })
+
+    return rows
+
+
+def print_comparison(rows: list[dict], threshold: float) -> None:
+    """比較結果を表示"""
+    print(f"\nベースラインとの比較（{threshold:g}%以上の悪化を退行とみなす）:")
+    for row in rows:
+        mark = "✗ 退行" if row["regression"] else ""
+        print(
+            f"  {row['case']:<12} {row['metric']:<22} {row['baseline']:>10} → {row['current']:>10}"
+            f" ({row['change_percent']:+.1f}%) {mark}"
+        )
+
+    regressions = sum(row["regression"] for row in rows)
+    print(f"\n退行: {regressions}件" if regressions else "\n退行はありません")
+
+
+def _run_font_case(count: int, output_dir: Path, ext: str, cached: bool) -> dict:
+    """
+    子プロセス内でフォントの取得とプレースホルダーの生成をそれぞれ count 件計測
+
+    cached が False の場合は、フォントを取得するたびにフォントのキャッシュだけを捨てて
+    従来どおり毎回フォントを探して読み込む状態を再現する（ベース画像のキャッシュはどちらも使う）。
+    """
+    get_font = placeholder_generator.get_font
+
+    def uncached(size: int = 24):
+        placeholder_generator.find_font_path.cache_clear()
+        get_font.cache_clear()
+        return get_font(size)
+
+    if not cached:
+        placeholder_generator.get_font = uncached
+
+    try:
+        # フォントの取得のみ（1件あたりメインとファイル名の2サイズ）
+        sizes = [
+            max(16, min(min(parse_size(size)) // 8, 48))
+            for size in PLACEHOLDER_SIZES
+        ]
+        start = time.perf_counter()
+        for i in range(count):
+            size = sizes[i % len(sizes)]
+            placeholder_generator.get_font(size)
+            placeholder_generator.get_font(size // 2)
+        lookup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            images = placeholder_generator.process_batch(placeholder_batch(count), output_dir, ext)
+        elapsed = time.perf_counter() - start
+    finally:
+        placeholder_generator.get_font = get_font
+
+    return {
+        "cached": cached,
+        "images": images,
+        "lookup_ms_per_image": round(lookup / count * 1000, 3),
+        "seconds": round(elapsed, 3),
+        "ms_per_image": round(elapsed / images * 1000, 2),
+    }
+
+
+def bench_fonts(work_dir: Path, count: int = 500, ext: str = ".webp") -> list[dict]:
+    """フォントのキャッシュなし／ありで、フォントの取得時間とプレースホルダーの一括生成時間を比較"""
+    results = []
+    context = get_context("spawn")
+
+    for cached in (False, True):
+        output_dir = work_dir / f"fonts-{'cached' if cached else 'uncached'}"
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(_run_font_case, count, output_dir, ext, cached).result())
+
+    return results
+
+
+def print_font_results(results: list[dict]) -> None:
+    """フォント読み込みの計測結果を表示（キャッシュなしを基準に比較）"""
+    baseline = results[0]
+
+    print(f"{'キャッシュ':<5} {'枚数':>4} {'取得ms/枚':>10} {'速度比':>7} {'生成ms/枚':>10} {'速度比':>7}")
+    for result in results:
+        label = "あり" if result["cached"] else "なし"
+        lookup_speedup = baseline["lookup_ms_per_image"] / max(result["lookup_ms_per_image"], 0.001)
+        speedup = baseline["seconds"] / result["seconds"]
+        print(
+            f"{label:<8} {result['images']:>6} {result['lookup_ms_per_image']:>13.3f} {lookup_speedup:>9.1f}x"
+            f" {result['ms_per_image']:>13.2f} {speedup:>9.2f}x"
+        )
+
+
+def _run_draft_case(
+    paths: list[Path],
+    output_dir: Path,
+    max_width: int,
+    reducing_gap: Optional[float]
+) -> dict:
+    """子プロセス内で1設定分の画像を処理して計測"""
+    start = time.perf_counter()
+
+    for path in paths:
+        result = image_processor.process_image(
+            path,
+            output_dir / path.name,
+            max_width=max_width,
+            reducing_gap=reducing_gap
+        )
+        if not result["success"]:
+            raise RuntimeError(", ".join(result["action"]))
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "reducing_gap": reducing_gap,
+        "images": len(paths),
+        "seconds": round(elapsed, 3),
+        "seconds_per_image": round(elapsed / len(paths), 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_draft(
+    paths: list[Path],
+    work_dir: Path,
+    gaps: list[Optional[float]],
+    max_width: int = 1200
+) -> list[dict]:
+    """
+    reducing_gap ごとの処理時間とピークメモリを計測
+
+    ピークメモリを設定ごとに分けて測るため、毎回新しいプロセスで実行する。
+    """
+    results = []
+    context = get_context("spawn")
+
+    for gap in gaps:
+        output_dir = work_dir / f"out-{gap or 'full'}"
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(_run_draft_case, paths, output_dir, max_width, gap).result())
+
+    return results
+
+
+def print_draft_results(results: list[dict]) -> None:
+    """計測結果を表形式で表示（先頭の設定を基準に比較）"""
+    baseline = results[0]
+
+    print(f"{'reducing_gap':>12} {'秒/枚':>8} {'速度比':>8} {'ピークRSS(MB)':>14}")
+    for result in results:
+        label = result["reducing_gap"] or "なし"
+        speedup = baseline["seconds"] / result["seconds"]
+        rss = result["peak_rss_mb"]
+        rss_text = f"{rss:.0f}" if rss is not None else "-"
+        print(f"{label:>12} {result['seconds_per_image']:>8.3f} {speedup:>7.2f}x {rss_text:>14}")
+
+
+def bench_pipeline(input_dir: Path, work_dir: Path, jobs: int, pipeline_mb: int, max_width: int = 1200) -> list[dict]:
+    """
+    同じ画像を逐次処理・プロセスプール・パイプライン（--pipeline）で処理して計測
+
+    キャッシュは使わず、毎回別の出力ディレクトリに書き込む。
+    """
+    modes = [
+        ("serial", 1, None),
+        ("jobs", jobs, None),
+        ("pipeline", jobs, pipeline_mb),
+    ]
+    results = []
+
+    for mode, mode_jobs, mode_pipeline_mb in modes:
+        start = time.perf_counter()
+        processed = [
+            result
+            for result in image_processor.process_directory(
+                input_dir,
+                work_dir / mode,
+                max_width=max_width,
+                jobs=mode_jobs,
+                pipeline_mb=mode_pipeline_mb
+            )
+            if result.get("index") is not None
+        ]
+        elapsed = time.perf_counter() - start
+        images = sum(result["success"] for result in processed)
+        results.append({
+            "mode": mode,
+            "jobs": mode_jobs,
+            "images": images,
+            "errors": len(processed) - images,
+            "seconds": round(elapsed, 3),
+            "images_per_second": round(images / elapsed, 2),
+        })
+
+    return results
+
+
+def print_pipeline_results(results: list[dict]) -> None:
+    """処理方法ごとの計測結果を表示（逐次処理を基準に比較）"""
+    baseline = results[0]
+
+    print(f"{'方法':<8} {'並列数':>4} {'枚数':>4} {'秒':>7} {'枚/秒':>7} {'速度比':>7}")
+    for result in results:
+        speedup = baseline["seconds"] / result["seconds"]
+        print(
+            f"{result['mode']:<10} {result['jobs']:>6} {result['images']:>6} {result['seconds']:>8.3f}"
+            f" {result['images_per_second']:>9.2f} {speedup:>8.2f}x"
+        )
+
+
+def server_requests(paths: list[Path], root: Path, widths: list[int], formats: list[str], count: int, seed: int) -> list[str]:
+    """
+    負荷試験のリクエストURL（パスとクエリ）を生成
+
+    実際の閲覧のように一部の画像・サイズに偏るよう、組み合わせごとに 1/順位 の重みで選ぶ。
+    """
+    rng = random.Random(seed)
+    targets = [
+        f"/{quote(path.relative_to(root).as_posix())}?w={width}&fmt={fmt}"
+        for path in paths
+        for width in widths
+        for fmt in formats
+    ]
+    rng.shuffle(targets)
+    weights = [1 / rank for rank in range(1, len(targets) + 1)]
+    return rng.choices(targets, weights, k=count)
+
+
+def _send_requests(address: tuple[str, int], targets: list[str], revalidate: float, seed: int) -> list[dict]:
+    """1つの接続（keep-alive）で順にリクエストを送り、結果を記録"""
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(*address)
+    etags = {}
+    records = []
+
+    try:
+        for target in targets:
+            headers = {}
+            # 一度取得したURLは、一定の割合でブラウザのように ETag で確認する
+            if target in etags and rng.random() < revalidate:
+                headers["If-None-Match"] = etags[target]
+            start = time.perf_counter()
+            connection.request("GET", target, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+            elapsed = time.perf_counter() - start
+            if response.getheader("ETag"):
+                etags[target] = response.getheader("ETag")
+            records.append({
+                "status": response.status,
+                "cache": response.getheader("X-Cache", "-"),
+                "bytes": len(body),
+                "seconds": elapsed,
+            })
+    finally:
+        connection.close()
+
+    return records
+
+
+def bench_server(
+    address: tuple[str, int],
+    targets: list[str],
+    concurrency: int,
+    revalidate: float,
+    seed: int
+) -> dict:
+    """リクエストを concurrency 本の接続に分けて同時に送り、集計する"""
+    chunks = [targets[i::concurrency] for i in range(concurrency)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        records = [
+            record
+            for chunk in executor.map(lambda args: _send_requests(address, *args), [(chunk, revalidate, seed + i) for i, chunk in enumerate(chunks)])
+            for record in chunk
+        ]
+    elapsed = time.perf_counter() - start
+
+    latencies = [record["seconds"] for record in records]
+    cache_states = {}
+    for record in records:
+        cache_states[record["cache"]] = cache_states.get(record["cache"], 0) + 1
+    errors = sum(record["status"] >= 400 for record in records)
+    hits = sum(cache_states.get(state, 0) for state in SERVER_HIT_STATES)
+
+    return {
+        "requests": len(records),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(records) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "hit_ratio": round(hits / len(records), 3),
+        "cache": cache_states,
+        "errors": errors,
+        "megabytes": round(sum(record["bytes"] for record in records) / 1024 / 1024, 2),
+    }
+
+
+def print_server_results(result: dict) -> None:
+    """負荷試験の結果を表示"""
+    print(f"リクエスト: {result['requests']}件（同時接続 {result['concurrency']}、{result['seconds']:.2f}秒、{result['megabytes']:.1f}MB）")
+    print(f"リクエスト/秒: {result['requests_per_second']:.1f}")
+    print(f"レイテンシ: p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms")
+    print(f"キャッシュヒット率: {result['hit_ratio'] * 100:.1f}%（{', '.join(f'{state} {count}' for state, count in sorted(result['cache'].items()))}）")
+    if result["errors"]:
+        print(f"エラー: {result['errors']}件")
+
+
+def parse_gaps(gaps_str: str) -> list[Optional[float]]:
+    """倍率リストをパース（0 は全画素処理 = None）"""
+    return [float(value) or None for value in gaps_str.split(",")]
+
+
+def parse_size(size_str: str) -> tuple[int, int]:
+    """サイズ文字列をパース（例: "6000x4000" → (6000, 4000)）"""
+    width, height = (int(value) for value in size_str.lower().split("x"))
+    return width, height
+
+
+def run_suite(args) -> int:
+    """suite サブコマンド"""
+    cases = [case.strip() for case in args.cases.split(",")]
+    unknown = [case for case in cases if case not in SUITE_CASES]
+    if unknown:
+        print(f"エラー: 不明なケース: {', '.join(unknown)}（{', '.join(SUITE_CASES)} から指定）")
+        return 1
+
+    baseline = None
+    if args.baseline:
+        if not args.baseline.exists():
+            print(f"エラー: ベースラインが見つかりません: {args.baseline}")
+            return 1
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+
+    settings = {
+        "jobs": args.jobs,
+        "quality": args.quality,
+        "max_width": args.max_width,
+        "formats": image_processor.parse_formats(args.formats) if args.formats else None,
+        "placeholders": args.placeholders,
+        "placeholder_ext": args.placeholder_ext,
+    }
+    jpeg_size = parse_size(args.jpeg_size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        print(f"合成画像を生成中: JPEG {args.jpegs}枚 ({args.jpeg_size}), 透過PNG {args.pngs}枚, GIF {args.gifs}枚, アイコン {args.icons}枚")
+        # Linuxではピークメモリが子プロセスに引き継がれるため、生成も別プロセスで行う
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            corpus = executor.submit(
+                make_suite_corpus, work_dir / "corpus", args.jpegs, jpeg_size, args.pngs, args.gifs, args.icons
+            ).result()
+        write_suite_config(corpus, work_dir / "suite.json", settings)
+
+        print(f"計測中: {', '.join(cases)}（並列数 {args.jobs}、{args.repeat}回ずつ）")
+        print("-" * 40)
+        results = bench_suite(corpus, work_dir, cases, settings, args.repeat)
+
+    print_suite_results(results)
+
+    report = {
+        "environment": environment_info(),
+        "settings": {**settings, "repeat": args.repeat},
+        "corpus": {kind: sum(item["kind"] == kind for item in corpus) for kind in ("jpeg", "png", "gif", "icon")},
+        "results": results,
+    }
+
+    regressions = 0
+    if baseline:
+        if baseline.get("settings") != report["settings"] or baseline.get("corpus") != report["corpus"]:
+            print("\n注意: ベースラインと設定またはコーパスが異なるため、単純には比較できません")
+        rows = compare_results(results, baseline.get("results", {}), args.threshold)
+        print_comparison(rows, args.threshold)
+        report["comparison"] = rows
+        regressions = sum(row["regression"] for row in rows)
+
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n結果を保存しました: {args.json}")
+
+    return 1 if regressions else 0
+
+
+def run_fonts(args) -> int:
+    """fonts サブコマンド"""
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"プレースホルダー {args.count}件の生成を計測中（拡張子 {args.ext}）")
+        print("-" * 40)
+        results = bench_fonts(Path(tmp), args.count, args.ext)
+
+    print_font_results(results)
+
+    if args.json:
+        args.json.write_text(json.dumps({"fonts": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n結果を保存しました: {args.json}")
+
+    return 0
+
+
+def run_draft(args) -> int:
+    """draft サブコマンド"""
+    width, height = parse_size(args.size)
+    gaps = parse_gaps(args.gaps)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        print(f"合成画像を生成中: {args.count}枚 ({width}x{height})")
+        # Linuxではピークメモリが子プロセスに引き継がれるため、生成も別プロセスで行う
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            paths = executor.submit(make_jpeg_corpus, work_dir / "corpus", args.count, (width, height)).result()
+
+        print(f"縮小デコードを計測中: 最大幅 {args.max_width}px")
+        print("-" * 40)
+        results = bench_draft(paths, work_dir, gaps, args.max_width)
+
+    print_draft_results(results)
+
+    if args.json:
+        args.json.write_text(json.dumps({"draft": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n結果を保存しました: {args.json}")
+
+    return 0
+
+
+def run_pipeline(args) -> int:
+    """pipeline サブコマンド"""
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        if args.input:
+            if not args.input.is_dir():
+                print(f"エラー: 入力ディレクトリが見つかりません: {args.input}")
+                return 1
+            input_dir = args.input
+        else:
+            input_dir = work_dir / "corpus"
+            print(f"合成画像を生成中: {args.count}枚 ({args.size})")
+            make_jpeg_corpus(input_dir, args.count, parse_size(args.size))
+
+        print(f"計測中: 逐次処理、並列数 {args.jobs}、並列数 {args.jobs} + パイプライン（先読み {args.pipeline_mb}MB まで）")
+        print("-" * 40)
+        results = bench_pipeline(input_dir, work_dir / "out", args.jobs, args.pipeline_mb, args.max_width)
+
+    print_pipeline_results(results)
+
+    if args.json:
+        args.json.write_text(json.dumps({"pipeline": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n結果を保存しました: {args.json}")
+
+    return 0
+
+
+def run_server(args) -> int:
+    """server サブコマンド"""
+    widths = image_processor.parse_widths(args.widths)
+    formats = image_processor.parse_formats(args.formats)
+
+    if args.concurrency < 1 or args.requests < 1:
+        print("エラー: --requests・--concurrency は 1 以上で指定してください")
+        return 1
+    if not 0 <= args.revalidate <= 1:
+        print("エラー: --revalidate は 0〜1 で指定してください")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.input:
+            if not args.input.is_dir():
+                print(f"エラー: 入力ディレクトリが見つかりません: {args.input}")
+                return 1
+            root = args.input
+            paths = [path for path in image_processor.scan_images(root) if path.suffix.lower() in image_processor.IMAGE_EXTENSIONS]
+        else:
+            root = Path(tmp) / "corpus"
+            print(f"合成画像を生成中: {args.count}枚 ({args.size})")
+            paths = make_jpeg_corpus(root, args.count, parse_size(args.size))
+
+        if not paths:
+            print(f"エラー: 画像が見つかりません: {root}")
+            return 1
+
+        targets = server_requests(paths, root, widths, formats, args.requests, args.seed)
+
+        server = None
+        if args.url:
+            url = urlsplit(args.url)
+            address = (url.hostname, url.port or 80)
+        else:
+            disk_cache = Path(tmp) / "cache" if args.disk_mb else None
+            server = image_server.create_server(
+                root,
+                port=0,
+                jobs=args.jobs,
+                memory_mb=args.memory_mb,
+                disk_cache=disk_cache,
+                disk_mb=args.disk_mb,
+                quiet=True
+            )
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            address = server.server_address[:2]
+
+        print(f"負荷試験中: 画像 {len(paths)}枚 × 幅 {len(widths)} × 形式 {len(formats)}、http://{address[0]}:{address[1]}/")
+        print("-" * 40)
+        try:
+            result = bench_server(address, targets, args.concurrency, args.revalidate, args.seed)
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+                server.executor.shutdown()
+
+    if server:
+        result["server"] = server.usage()
+
+    print_server_results(result)
+
+    if args.json:
+        report = {
+            "environment": environment_info(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("handler", "json")},
+            "server": result,
+        }
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"\n結果を保存しました: {args.json}")
+
+    return 1 if result["errors"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="画像ヘルパーのベンチマーク",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 全ケースを計測して結果を保存
+  python benchmark.py suite --json baseline.json
+
+  # 変更後に計測し、ベースラインと比較（悪化が --threshold % を超えたら終了コード1）
+  python benchmark.py suite --baseline baseline.json --json current.json
+
+  # ケース・並列数・コーパスの大きさを指定
+  python benchmark.py suite --cases directory,config --jobs 4 --jpegs 8 --jpeg-size 6000x4000
+
+  # フォントのキャッシュの効果を計測（プレースホルダー500件）
+  python benchmark.py fonts --count 500
+
+  # 縮小デコードの効果を計測（0 は縮小デコードなし）
+  python benchmark.py draft --count 8 --size 4000x3000 --gaps 0,1.5,2,4
+
+  # 逐次処理・並列処理・--pipeline の処理速度を比較（元画像は遅いストレージに置いて計測）
+  python benchmark.py pipeline --input //nas/photos --jobs 4
+
+  # 画像変換サーバーの負荷試験（--url 省略時はサーバーをこのプロセス内で起動）
+  python benchmark.py server --input ./images --requests 2000 --concurrency 16
+  python benchmark.py server --input ./images --url http://127.0.0.1:8400
+        """
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    suite = subparsers.add_parser("suite", help="画像ヘルパー全体の処理速度・レイテンシ・ピークメモリを計測")
+    suite.add_argument("--cases", type=str, default=",".join(SUITE_CASES), help=f"計測するケース（カンマ区切り、デフォルト: {','.join(SUITE_CASES)}）")
+    suite.add_argument("--jobs", "-j", type=int, default=1, help="並列数（image_processor・placeholder_generator 共通、デフォルト: 1）")
+    suite.add_argument("--quality", "-q", type=int, default=85, help="画像品質（デフォルト: 85）")
+    suite.add_argument("--max-width", "-W", type=int, default=1200, help="リサイズ後の最大幅（デフォルト: 1200）")
+    suite.add_argument("--formats", type=str, help="出力形式（カンマ区切り、例: avif,webp）")
+    suite.add_argument("--jpegs", type=int, default=4, help="大きなJPEGの枚数（デフォルト: 4）")
+    suite.add_argument("--jpeg-size", type=str, default="4000x3000", help="大きなJPEGのサイズ（デフォルト: 4000x3000）")
+    suite.add_argument("--pngs", type=int, default=4, help="透過PNG（1600x1200）の枚数（デフォルト: 4）")
+    suite.add_argument("--gifs", type=int, default=4, help="パレットGIF（800x600）の枚数（デフォルト: 4）")
+    suite.add_argument("--icons", type=int, default=16, help="アイコン（64x64 PNG）の枚数（デフォルト: 16）")
+    suite.add_argument("--placeholders", type=int, default=100, help="生成するプレースホルダーの数（デフォルト: 100）")
+    suite.add_argument("--placeholder-ext", type=str, default=".webp", help="プレースホルダーの拡張子（デフォルト: .webp）")
+    suite.add_argument("--repeat", "-r", type=int, default=1, help="ケースごとの実行回数（処理時間が中央値の回を採用、デフォルト: 1）")
+    suite.add_argument("--baseline", type=Path, help="比較するベースライン（suite --json で保存した結果）")
+    suite.add_argument("--threshold", type=float, default=10.0, help="退行とみなす悪化の割合（%%、デフォルト: 10）")
+    suite.add_argument("--json", type=Path, help="結果をJSONで保存するパス")
+    suite.set_defaults(handler=run_suite)
+
+    fonts = subparsers.add_parser("fonts", help="プレースホルダーのフォントのキャッシュの効果を計測（フォントの取得のみと一括生成）")
+    fonts.add_argument("--count", "-n", type=int, default=500, help="生成するプレースホルダーの数（デフォルト: 500）")
+    fonts.add_argument("--ext", "-e", type=str, default=".webp", help="プレースホルダーの拡張子（デフォルト: .webp）")
+    fonts.add_argument("--json", type=Path, help="結果をJSONで保存するパス")
+    fonts.set_defaults(handler=run_fonts)
+
+    draft = subparsers.add_parser("draft", help="縮小デコード（reducing_gap）の効果を計測")
+    draft.add_argument("--count", "-n", type=int, default=4, help="合成画像の枚数（デフォルト: 4）")
+    draft.add_argument("--size", "-s", type=str, default="6000x4000", help="合成画像のサイズ（デフォルト: 6000x4000）")
+    draft.add_argument("--max-width", "-W", type=int, default=1200, help="リサイズ後の最大幅（デフォルト: 1200）")
+    draft.add_argument("--gaps", type=str, default="0,2,3", help="比較する reducing_gap（カンマ区切り、0は縮小デコードなし）")
+    draft.add_argument("--json", type=Path, help="結果をJSONで保存するパス")
+    draft.set_defaults(handler=run_draft)
+
+    pipeline = subparsers.add_parser("pipeline", help="逐次処理・並列処理・パイプライン（--pipeline）の処理速度を比較")
+    pipeline.add_argument("--input", "-i", type=Path, help="処理する画像のディレクトリ（省略時は合成JPEGを生成）")
+    pipeline.add_argument("--count", "-n", type=int, default=16, help="合成画像の枚数（--input 省略時、デフォルト: 16）")
+    pipeline.add_argument("--size", "-s", type=str, default="3000x2000", help="合成画像のサイズ（--input 省略時、デフォルト: 3000x2000）")
+    pipeline.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="並列数（デフォルト: CPUコア数）")
+    pipeline.add_argument("--pipeline-mb", type=int, default=image_processor.PIPELINE_MAX_MB, help=f"先読みする元画像の合計の上限（MB、デフォルト: {image_processor.PIPELINE_MAX_MB}）")
+    pipeline.add_argument("--max-width", "-W", type=int, default=1200, help="リサイズ後の最大幅（デフォルト: 1200）")
+    pipeline.add_argument("--json", type=Path, help="結果をJSONで保存するパス")
+    pipeline.set_defaults(handler=run_pipeline)
+
+    server = subparsers.add_parser("server", help="画像変換サーバー（image_server.py）のリクエスト/秒とキャッシュヒット率を計測")
+    server.add_argument("--input", "-i", type=Path, help="配信する画像のディレクトリ（省略時は合成JPEGを生成）")
+    server.add_argument("--url", type=str, help="計測するサーバーのURL（省略時はこのプロセス内で起動。--input と同じディレクトリを配信していること）")
+    server.add_argument("--count", "-n", type=int, default=8, help="合成画像の枚数（--input 省略時、デフォルト: 8）")
+    server.add_argument("--size", "-s", type=str, default="2000x1500", help="合成画像のサイズ（--input 省略時、デフォルト: 2000x1500）")
+    server.add_argument("--requests", type=int, default=1000, help="リクエスト数（デフォルト: 1000）")
+    server.add_argument("--concurrency", "-c", type=int, default=8, help="同時接続数（デフォルト: 8）")
+    server.add_argument("--widths", type=str, default="320,640,1024", help="リクエストする幅（カンマ区切り、デフォルト: 320,640,1024）")
+    server.add_argument("--formats", type=str, default="webp", help="リクエストする形式（カンマ区切り、デフォルト: webp）")
+    server.add_argument("--revalidate", type=float, default=0.0, help="取得済みのURLを ETag で確認する割合（0〜1、デフォルト: 0）")
+    server.add_argument("--seed", type=int, default=0, help="リクエストの組み合わせを決める乱数の種（デフォルト: 0）")
+    server.add_argument("--jobs", "-j", type=int, default=None, help="サーバーの変換の並列数（デフォルト: CPUコア数）")
+    server.add_argument("--memory-mb", type=int, default=image_server.DEFAULT_MEMORY_MB, help=f"サーバーのメモリキャッシュの上限（MB、デフォルト: {image_server.DEFAULT_MEMORY_MB}）")
+    server.add_argument("--disk-mb", type=int, default=0, help="サーバーのディスクキャッシュの上限（MB、一時ディレクトリに作成、デフォルト: 0 = 使わない）")
+    server.add_argument("--json", type=Path, help="結果をJSONで保存するパス")
+    server.set_defaults(handler=run_server)
+
+    args = parser.parse_args()
+
+    if not PIL_AVAILABLE:
+        print("エラー: Pillowがインストールされていません")
+        return 1
+
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -23,25 +23,136 @@
 
     # JSON設定ファイルでリネーム処理
     python image_processor.py --config images.json --input ./raw_images --output ./images
+
+    # 並列数を指定（デフォルト: CPUコア数）
+    python image_processor.py --input ./raw_images --output ./images --jobs 4
+
+    # キャッシュを使わず全画像を再処理
+    python image_processor.py --input ./raw_images --output ./images --no-cache
+
+    # 縮小デコードで高速化（出力の画素は全画素からのリサイズと少し変わる）
+    python image_processor.py --input ./raw_images --output ./images --reducing-gap
+
+    # srcset用に複数の幅を生成
+    python image_processor.py --input ./raw_images --output ./images --widths 480,768,1200,2000
+
+    # AVIF・WebP・JPEGを同時に出力
+    python image_processor.py --input ./raw_images --output ./images --formats avif,webp,jpeg
+
+    # 目標ファイルサイズ（KB）に収まる品質を自動で選ぶ
+    python image_processor.py --input ./raw_images --output ./images --target-kb 150
+
+    # SSIMの下限を保てる最も低い品質を自動で選ぶ
+    python image_processor.py --input ./raw_images --output ./images --min-ssim 0.95
 """
 
 import argparse
+import asyncio
+import base64
+import cProfile
+import fnmatch
+import hashlib
+import io
+import itertools
 import json
+import math
+import os
+import queue
 import shutil
+import signal
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageChops, ImageSequence, ImageStat, UnidentifiedImageError, features
     PIL_AVAILABLE = True
 except ImportError:
     PIL_AVAILABLE = False
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    INOTIFY_AVAILABLE = True
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
+try:
+    import resource
+except ImportError:
+    # Windowsでは resource モジュールがないためピークメモリは計測しない
+    resource = None
+
 
 # 処理対象の画像拡張子
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp"}
 # 変換せずそのままコピーする拡張子
 COPY_EXTENSIONS = {".svg", ".ico"}
+# ディレクトリ一括処理でたどらないディレクトリ（fnmatch形式）
+DEFAULT_IGNORE_PATTERNS = (".git", "node_modules")
+# --watch で最後の変更からまとめて処理するまでの待ち時間（秒）とポーリング間隔（秒）
+WATCH_DEBOUNCE = 0.3
+WATCH_POLL_INTERVAL = 0.5
+# inotify のイベントを待つ時間（秒、待ち時間の経過を確認する間隔）
+WATCH_INOTIFY_TIMEOUT = 0.1
+# 出力ディレクトリに置くキャッシュマニフェストのファイル名
+CACHE_FILENAME = ".image_processor_cache.json"
+CACHE_VERSION = 1
+# srcset用に生成した画像の一覧を書き込むマニフェストのファイル名
+SRCSET_MANIFEST_FILENAME = "srcset.json"
+PREVIEW_MANIFEST_FILENAME = "placeholders.json"
+ASSET_MANIFEST_FILENAME = "assets.json"
+# フィンガープリント（ファイル名に入れる内容ハッシュ）の桁数
+FINGERPRINT_LENGTH = 8
+# --pipeline で同時に扱う元画像のバイト数の上限（MB）
+PIPELINE_MAX_MB = 256
+# --reducing-gap を値なしで指定した場合・--memory-mb 指定時に使う、縮小デコード・整数縮小で残す目標サイズに対する倍率
+# （出力の画素が変わるため、デフォルトでは縮小デコードしない。resize_image 参照）
+DEFAULT_REDUCING_GAP = 2.0
+# --formats で指定できる出力形式と拡張子
+FORMAT_EXTENSIONS = {"avif": ".avif", "webp": ".webp", "jpeg": ".jpg", "png": ".png"}
+# 処理結果のうち、出力ファイルの詳細としてキャッシュに記録するキー
+OUTPUT_DETAIL_KEYS = ("variants", "formats", "preview", "assets", "perceptual_hash")
+# 品質を指定できる（目標サイズの品質探索の対象になる）出力形式の拡張子
+LOSSY_EXTENSIONS = {".webp", ".jpg", ".jpeg", ".avif"}
+# 目標サイズの品質探索の下限品質と最大エンコード回数
+TARGET_MIN_QUALITY = 30
+TARGET_SEARCH_MAX_ITERATIONS = 7
+# PNGの最適化（--png-optimize）でパレット化する色数と、減色で許す誤差のデフォルト（チャンネルごとの平均絶対誤差）
+PNG_PALETTE_COLORS = 256
+DEFAULT_PNG_TOLERANCE = 1.0
+# PNGの最適化でパレット画像に試す zlib の圧縮方法（optimize=True だけの保存に加えて比較する）
+PNG_STRATEGIES = {
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+# SSIMを計算する窓のサイズ（ピクセル）
+SSIM_WINDOW = 7
+# --profile で計測する処理段階
+PROFILE_STAGES = ("open", "decode", "convert", "resize", "encode", "preview")
+# プレビュー（LQIP）の長辺（ピクセル）と品質
+LQIP_SIZE = 24
+LQIP_QUALITY = 30
+# BlurHashの成分数（横, 縦）
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE_SIZE = 32
+BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+# 知覚ハッシュの一辺のビット数（8x8 = 64ビット）
+HASH_SIZE = 8
+# pHashでDCTをかける縮小画像の一辺（ピクセル）
+PHASH_SAMPLE_SIZE = 32
 
 
 def get_image_info(image_path: Path) -> dict:
@@ -61,34 +172,76 @@ def get_image_info(image_path: Path) -> dict:
         return {"error": str(e)}
 
 
-def resize_image(
-    img: Image.Image,
+@contextmanager
+def measure(timings: Optional[dict], stage: str):
+    """timings が辞書なら、ブロックの処理時間（秒）を stage に加算する"""
+    if timings is None:
+        yield
+        return
+    
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def reset_peak_rss() -> None:
+    """ピークRSSをリセット（Linuxのみ。他の環境ではプロセス開始からのピークのまま）"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> Optional[float]:
+    """現在のプロセスのピークRSS（MB）を取得（計測できない環境では None）"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    
+    if resource is None:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def calc_resize_size(
+    width: int,
+    height: int,
     max_width: Optional[int],
     max_height: Optional[int]
-) -> Image.Image:
-    """アスペクト比を維持してリサイズ"""
-    
-    original_width, original_height = img.size
+) -> tuple[int, int]:
+    """アスペクト比を維持したリサイズ後のサイズを計算（縮小不要なら元のサイズ）"""
     
     # リサイズが不要な場合
     if max_width is None and max_height is None:
-        return img
+        return width, height
     
     # 現在のサイズが制限以下なら何もしない
-    width_ok = max_width is None or original_width <= max_width
-    height_ok = max_height is None or original_height <= max_height
+    width_ok = max_width is None or width <= max_width
+    height_ok = max_height is None or height <= max_height
     
     if width_ok and height_ok:
-        return img
+        return width, height
     
     # アスペクト比を計算
-    aspect_ratio = original_width / original_height
+    aspect_ratio = width / height
     
     # 新しいサイズを計算
-    new_width = original_width
-    new_height = original_height
+    new_width = width
+    new_height = height
     
-    if max_width and original_width > max_width:
+    if max_width and width > max_width:
         new_width = max_width
         new_height = int(max_width / aspect_ratio)
     
@@ -96,106 +249,2141 @@ def resize_image(
         new_height = max_height
         new_width = int(max_height * aspect_ratio)
     
+    return new_width, new_height
+
+
+def resize_image(
+    img: Image.Image,
+    max_width: Optional[int],
+    max_height: Optional[int],
+    reducing_gap: Optional[float] = None,
+    source_size: Optional[tuple[int, int]] = None
+) -> Image.Image:
+    """
+    アスペクト比を維持してリサイズ
+
+    Args:
+        img: 元画像
+        max_width: 最大幅
+        max_height: 最大高さ
+        reducing_gap: 指定時は目標サイズのこの倍率まで整数縮小（reduce）してから
+            LANCZOSで仕上げる。大きいほど画質優先、None なら全画素からLANCZOS
+        source_size: サイズ計算に使う元画像サイズ（縮小デコード済みの画像を渡す場合に
+            元の解像度を指定すると、通常処理と同じ出力サイズになる）
+    """
+    width, height = source_size or img.size
+    new_size = calc_resize_size(width, height, max_width, max_height)
+    
+    if new_size == img.size:
+        return img
+    
     # リサイズ実行
-    return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
 
 
-def process_image(
-    input_path: Path,
-    output_path: Path,
-    max_width: Optional[int] = None,
-    max_height: Optional[int] = None,
-    convert_to_webp: bool = True,
-    quality: int = 85
+def decoded_bytes(size: tuple[int, int], mode: str) -> int:
+    """デコード後の画像がメモリ上で占めるおよそのバイト数（Pillowは RGB も1画素4バイトで持つ）"""
+    if mode in ("1", "L", "P"):
+        pixel_bytes = 1
+    elif mode.startswith("I;16"):
+        pixel_bytes = 2
+    else:
+        pixel_bytes = 4
+    return size[0] * size[1] * pixel_bytes
+
+
+def estimate_memory(size: tuple[int, int], mode: str, target_size: tuple[int, int], convert: bool) -> int:
+    """
+    1枚の処理に必要なおよそのメモリ（バイト）
+
+    デコード後の画像、RGB変換する（convert）ならその複製、リサイズの作業領域と出力（出力サイズの2枚分）の合計。
+    """
+    needed = decoded_bytes(size, mode) + decoded_bytes(target_size, "RGBA") * 2
+    if convert:
+        needed += decoded_bytes(size, "RGB")
+    return needed
+
+
+def draft_image(img: Image.Image, size: tuple[int, int], reducing_gap: Optional[float]) -> Optional[int]:
+    """
+    JPEGを縮小デコードするよう設定（画像データ読み込み前に呼ぶ）
+
+    デコーダは 1/2, 1/4, 1/8 のいずれかで縮小するため、
+    目標サイズの reducing_gap 倍以上が残る範囲で最も小さいスケールを選ぶ。
+
+    Returns:
+        縮小率の分母（縮小しなかった場合は None）
+    """
+    if not reducing_gap or img.format != "JPEG" or size == img.size:
+        return None
+    
+    original_width = img.width
+    requested = (int(size[0] * reducing_gap), int(size[1] * reducing_gap))
+    img.draft(img.mode, requested)
+    
+    scale = round(original_width / img.width)
+    return scale if scale > 1 else None
+
+
+def srcset_widths(original_width: int, widths: list[int]) -> list[int]:
+    """
+    srcset用に生成する幅を大きい順に返す
+
+    元画像以上の幅は拡大になるため除外し、代わりに元画像の幅を1つ含める。
+    """
+    ladder = sorted({width for width in widths if width < original_width}, reverse=True)
+    
+    if any(width >= original_width for width in widths):
+        ladder.insert(0, original_width)
+    
+    return ladder
+
+
+def prepare_for_format(img: Image.Image, suffix: str) -> Image.Image:
+    """出力形式が扱えないモードの画像を変換（変換不要ならそのまま返す）"""
+    if suffix in (".jpg", ".jpeg"):
+        # JPEGはアルファチャンネルをサポートしないのでRGBに変換
+        if img.mode in ("RGBA", "LA"):
+            return img.convert("RGB")
+    elif suffix == ".avif":
+        if img.mode not in ("RGB", "RGBA"):
+            return img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+    return img
+
+
+def break_link(path: Path) -> None:
+    """
+    ハードリンクされた出力を書き換える前に切り離す
+
+    重複した元画像の出力（link_duplicate）は同じ実体を共有しているため、
+    そのまま上書きするともう一方の出力まで書き換わる。
+    """
+    if path.exists() and path.stat().st_nlink > 1:
+        path.unlink()
+
+
+def encode_image(img: Image.Image, fp, suffix: str, quality: int) -> None:
+    """
+    拡張子に応じた形式でエンコード
+
+    Args:
+        img: 画像
+        fp: 書き込み先（パスまたはファイルオブジェクト）
+        suffix: 出力形式を表す拡張子（例: ".webp"）
+        quality: 画像品質
+    """
+    suffix = suffix.lower()
+    img = prepare_for_format(img, suffix)
+    
+    if suffix == ".webp":
+        # アルファチャンネルがある場合
+        if img.mode in ("RGBA", "LA"):
+            img.save(fp, "WEBP", quality=quality, lossless=False)
+        else:
+            img.save(fp, "WEBP", quality=quality)
+    elif suffix in (".jpg", ".jpeg"):
+        img.save(fp, "JPEG", quality=quality)
+    elif suffix == ".avif":
+        img.save(fp, "AVIF", quality=quality)
+    elif suffix == ".png":
+        img.save(fp, "PNG", optimize=True)
+    else:
+        img.save(fp, Image.registered_extensions().get(suffix))
+
+
+def search_quality(
+    img: Image.Image,
+    suffix: str,
+    target_bytes: int,
+    max_quality: int,
+    max_iterations: int = TARGET_SEARCH_MAX_ITERATIONS
+) -> tuple[int, bytes]:
+    """
+    目標バイト数に収まる最も高い品質を二分探索（エンコードはメモリ上で行う）
+
+    max_quality で収まればそのまま使う。下限品質（TARGET_MIN_QUALITY、max_quality の方が低ければ
+    max_quality）でも収まらない場合は下限品質の結果を返す。
+
+    Returns:
+        (選んだ品質, エンコード済みのデータ)
+    """
+    img = prepare_for_format(img, suffix.lower())
+    encoded: dict[int, bytes] = {}
+    
+    def encode(quality: int) -> bytes:
+        if quality not in encoded:
+            buffer = io.BytesIO()
+            encode_image(img, buffer, suffix, quality)
+            encoded[quality] = buffer.getvalue()
+        return encoded[quality]
+    
+    data = encode(max_quality)
+    if len(data) <= target_bytes:
+        return max_quality, data
+    
+    min_quality = min(TARGET_MIN_QUALITY, max_quality)
+    low, high = min_quality, max_quality - 1
+    best: Optional[tuple[int, bytes]] = None
+    
+    for _ in range(max_iterations - 1):
+        if low > high:
+            break
+        
+        quality = (low + high) // 2
+        data = encode(quality)
+        
+        if len(data) <= target_bytes:
+            best = (quality, data)
+            low = quality + 1
+        else:
+            high = quality - 1
+    
+    if best is None:
+        return min_quality, encode(min_quality)
+    
+    return best
+
+
+def _window_mean(values: "np.ndarray", size: int) -> "np.ndarray":
+    """size x size の窓ごとの平均（積分画像で計算、画像内に収まる窓のみ）"""
+    integral = np.pad(values.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    return (
+        integral[size:, size:]
+        - integral[:-size, size:]
+        - integral[size:, :-size]
+        + integral[:-size, :-size]
+    ) / (size * size)
+
+
+def _ssim(x: "np.ndarray", y: "np.ndarray") -> float:
+    """2つのチャンネル（0-255の配列）のSSIMの平均"""
+    size = max(1, min(SSIM_WINDOW, *x.shape))
+    
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    
+    mu_x = _window_mean(x, size)
+    mu_y = _window_mean(y, size)
+    var_x = _window_mean(x * x, size) - mu_x * mu_x
+    var_y = _window_mean(y * y, size) - mu_y * mu_y
+    cov = _window_mean(x * y, size) - mu_x * mu_y
+    
+    ssim = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return float(ssim.mean())
+
+
+def compute_ssim(reference: Image.Image, candidate: Image.Image) -> float:
+    """
+    2枚の画像の構造的類似度（SSIM）を返す
+
+    1.0 で完全一致。窓は SSIM_WINDOW の正方形（画像がそれより小さい場合は画像サイズ）。
+    輝度は透過部分を白で塗りつぶしてから比較する（非可逆WebPは透明な画素のRGBを保持しないため）。
+    透過画像はアルファチャンネルのSSIMも計算し、低い方を返す。
+    """
+    def luminance(img: Image.Image) -> "np.ndarray":
+        return np.asarray(flatten_alpha(img).convert("L"), dtype=np.float64)
+    
+    score = _ssim(luminance(reference), luminance(candidate))
+    if has_alpha(reference):
+        alpha = np.asarray(reference.convert("RGBA").getchannel("A"), dtype=np.float64)
+        candidate_alpha = np.asarray(candidate.convert("RGBA").getchannel("A"), dtype=np.float64)
+        score = min(score, _ssim(alpha, candidate_alpha))
+    return score
+
+
+def search_ssim_quality(
+    img: Image.Image,
+    suffix: str,
+    min_ssim: float,
+    max_quality: int,
+    max_iterations: int = TARGET_SEARCH_MAX_ITERATIONS
+) -> tuple[int, bytes, float, int]:
+    """
+    SSIMが min_ssim 以上になる最も低い品質を二分探索（エンコード・比較はメモリ上で行う）
+
+    max_quality でも min_ssim に届かない場合は max_quality の結果を返す。
+
+    Returns:
+        (選んだ品質, エンコード済みのデータ, SSIM, max_quality で保存した場合のバイト数)
+    """
+    img = prepare_for_format(img, suffix.lower())
+    
+    def encode(quality: int) -> tuple[bytes, float]:
+        buffer = io.BytesIO()
+        encode_image(img, buffer, suffix, quality)
+        buffer.seek(0)
+        with Image.open(buffer) as candidate:
+            score = compute_ssim(img, candidate)
+        return buffer.getvalue(), score
+    
+    data, score = encode(max_quality)
+    baseline_bytes = len(data)
+    best = (max_quality, data, score)
+    
+    if score < min_ssim:
+        return max_quality, data, score, baseline_bytes
+    
+    low, high = TARGET_MIN_QUALITY, max_quality - 1
+    
+    for _ in range(max_iterations - 1):
+        if low > high:
+            break
+        
+        quality = (low + high) // 2
+        data, score = encode(quality)
+        
+        if score >= min_ssim:
+            best = (quality, data, score)
+            high = quality - 1
+        else:
+            low = quality + 1
+    
+    return (*best, baseline_bytes)
+
+
+def image_error(reference: Image.Image, candidate: Image.Image) -> float:
+    """2つの画像のチャンネルごとの平均絶対誤差（0-255）のうち最大のもの"""
+    difference = ImageChops.difference(reference, candidate.convert(reference.mode))
+    return max(ImageStat.Stat(difference).mean)
+
+
+def _rgb_keys(values: "np.ndarray") -> "np.ndarray":
+    """RGB（最後の軸）を24ビットの値にする"""
+    return (values[..., 0].astype(np.uint32) << 16) | (values[..., 1].astype(np.uint32) << 8) | values[..., 2]
+
+
+def palette_image(img: Image.Image) -> Optional[Image.Image]:
+    """
+    PNG_PALETTE_COLORS 色以下の画像を、画素を変えずにパレット画像にする（透過はパレットのアルファで保持、要NumPy）
+
+    Pillowの減色はパレットの近い色に丸めることがあるため、色 → 番号の表を引いて全画素を一括で置き換える。
+
+    Returns:
+        パレット画像（色数が多い場合・NumPyがない場合は None）
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    
+    mode = "RGBA" if has_alpha(img) else "RGB"
+    source = img if img.mode == mode else img.convert(mode)
+    colors = source.getcolors(PNG_PALETTE_COLORS)
+    if colors is None:
+        return None
+    
+    palette = np.array([color for _, color in colors], dtype=np.uint8)
+    pixels = np.asarray(source)
+    rgb_table = np.zeros(1 << 24, dtype=np.uint8)
+    
+    if mode == "RGBA":
+        # 同じRGBでアルファの違う色があるため、RGBの番号とアルファの2段で引く
+        rgb_keys, groups = np.unique(_rgb_keys(palette), return_inverse=True)
+        rgb_table[rgb_keys] = np.arange(len(rgb_keys))
+        alpha_table = np.zeros((len(rgb_keys), 256), dtype=np.uint8)
+        alpha_table[groups.ravel(), palette[:, 3]] = np.arange(len(palette))
+        indices = alpha_table[rgb_table[_rgb_keys(pixels)], pixels[..., 3]]
+    else:
+        rgb_table[_rgb_keys(palette)] = np.arange(len(palette))
+        indices = rgb_table[_rgb_keys(pixels)]
+    
+    converted = Image.frombytes("P", source.size, indices.tobytes())
+    converted.putpalette(palette[:, :3].tobytes())
+    if mode == "RGBA":
+        converted.info["transparency"] = palette[:, 3].tobytes()
+    return converted
+
+
+def quantize_image(img: Image.Image, tolerance: float) -> Optional[tuple[Image.Image, float]]:
+    """
+    PNG_PALETTE_COLORS 色に減色したパレット画像を作る（透過画像はアルファもパレットに含める）
+
+    Returns:
+        (パレット画像, 元画像との誤差)（誤差が tolerance を超える場合は None）
+    """
+    if has_alpha(img):
+        source = img if img.mode == "RGBA" else img.convert("RGBA")
+        # アルファを含めて減色できるのは FASTOCTREE だけ
+        quantized = source.quantize(PNG_PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+    else:
+        source = img if img.mode == "RGB" else img.convert("RGB")
+        quantized = source.quantize(PNG_PALETTE_COLORS)
+    
+    error = image_error(source, quantized)
+    return (quantized, error) if error <= tolerance else None
+
+
+def optimize_png(img: Image.Image, tolerance: float = DEFAULT_PNG_TOLERANCE) -> dict:
+    """
+    PNGを小さくエンコードする
+
+    PNG_PALETTE_COLORS 色以下の画像はそのままパレット画像にし、それ以外は減色して
+    誤差（image_error）が tolerance 以下ならパレット画像にする（0 なら色数の少ない画像だけ）。
+    各画像を optimize=True だけで保存し、パレット画像はさらに PNG_STRATEGIES の圧縮方法でも順にエンコードして、
+    最も小さいものを使う（フルカラーの画像は圧縮方法でほとんど差が出ず時間だけかかるため比較しない。
+    並列処理時は各ワーカーで呼ばれるため、ここではスレッドを増やさない）。
+
+    Returns:
+        {"data", "bytes", "png"}（"png" は {"palette", "colors", "error", "strategy", "bytes_saved"}。
+        "palette" は "lossless"・"quantized"・None、"strategy" は "optimize" か PNG_STRATEGIES のキー、
+        "bytes_saved" は元の画像を optimize=True だけで保存した場合との差）
+    """
+    img.load()
+    candidates = {None: (img, 0.0)}
+    
+    if img.mode != "P" or "transparency" in img.info:
+        lossless = palette_image(img)
+        if lossless is not None:
+            candidates["lossless"] = (lossless, 0.0)
+        elif tolerance > 0:
+            quantized = quantize_image(img, tolerance)
+            if quantized is not None:
+                candidates["quantized"] = quantized
+    
+    encoded = {}
+    for palette, (image, _) in candidates.items():
+        strategies = {"optimize": {}}
+        if image.mode == "P":
+            strategies.update((name, {"compress_type": compress_type}) for name, compress_type in PNG_STRATEGIES.items())
+        for strategy, options in strategies.items():
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG", optimize=True, **options)
+            encoded[(palette, strategy)] = buffer.getvalue()
+    
+    (palette, strategy), data = min(encoded.items(), key=lambda item: len(item[1]))
+    image, error = candidates[palette]
+    
+    return {
+        "data": data,
+        "bytes": len(data),
+        "png": {
+            "palette": palette,
+            "colors": len(image.getcolors(PNG_PALETTE_COLORS) or []) if palette else None,
+            "error": round(error, 3),
+            "strategy": strategy,
+            "bytes_saved": len(encoded[(None, "optimize")]) - len(data),
+        },
+    }
+
+
+def describe_png(png: dict) -> str:
+    """PNGの最適化結果の表示（例: "パレット 48色（可逆）、rle、12KB削減"）"""
+    if png["palette"] == "lossless":
+        method = f"パレット {png['colors']}色（可逆）"
+    elif png["palette"] == "quantized":
+        method = f"パレット {png['colors']}色（誤差 {png['error']:.2f}）"
+    else:
+        method = "フルカラー"
+    return f"{method}、{png['strategy']}、{png['bytes_saved'] / 1024:.0f}KB削減"
+
+
+def encode_output(
+    img: Image.Image,
+    suffix: str,
+    quality: int,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    png_tolerance: Optional[float] = None
 ) -> dict:
     """
-    単一画像を処理
+    拡張子に応じた形式でメモリ上にエンコード
+
+    target_kb を指定すると、品質を上限として目標サイズに収まる品質を探してエンコードする。
+    min_ssim を指定すると、品質を上限としてSSIMが min_ssim 以上になる最も低い品質を探してエンコードする。
+    （どちらもPNGなど品質のない形式では無視）
+    png_tolerance を指定すると、PNGはパレット化と圧縮方法の比較で小さくする（optimize_png）。
+
+    Returns:
+        {"data": エンコード結果, "bytes": バイト数}
+        （品質を探索した場合は "quality"、下限品質でも target_kb に収まらなかった場合は "over_target"、
+        min_ssim 指定時は "ssim" と "bytes_saved"、PNGを最適化した場合は "png" も含む）
+    """
+    suffix = suffix.lower()
+    searched = {}
+    
+    if png_tolerance is not None and suffix == ".png":
+        return optimize_png(img, png_tolerance)
+    
+    if min_ssim and suffix in LOSSY_EXTENSIONS:
+        searched["quality"], data, searched["ssim"], baseline_bytes = search_ssim_quality(img, suffix, min_ssim, quality)
+        searched["bytes_saved"] = baseline_bytes - len(data)
+    elif target_kb and suffix in LOSSY_EXTENSIONS:
+        searched["quality"], data = search_quality(img, suffix, target_kb * 1024, quality)
+        if len(data) > target_kb * 1024:
+            searched["over_target"] = True
+    else:
+        buffer = io.BytesIO()
+        encode_image(img, buffer, suffix, quality)
+        # getvalue は書き込み済みのバッファをそのまま bytes として返す（コピーしない）
+        data = buffer.getvalue()
+    
+    return {"data": data, **searched, "bytes": len(data)}
+
+
+def encode_formats(
+    img: Image.Image,
+    formats: list[str],
+    quality: int,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    png_tolerance: Optional[float] = None
+) -> dict:
+    """
+    同じ画像を複数の形式でエンコード（スレッドで並行実行）
+
+    Args:
+        img: エンコードする画像（形式ごとにコピーしてエンコードし、変更しない）
+        formats: 出力形式のリスト（FORMAT_EXTENSIONS のキー）
+        quality: 画像品質
+        target_kb: 目標ファイルサイズ（KB、形式ごとに適用）
+        min_ssim: SSIMの下限（形式ごとに適用）
+        png_tolerance: PNGの減色で許す誤差（指定時はPNGを最適化）
+
+    Returns:
+        形式ごとの encode_output の戻り値
+    """
+    # リサイズ不要だった画像は未読み込みのことがあり、スレッドから同時に load させない
+    img.load()
+    
+    def encode(fmt: str) -> dict:
+        # save() はエンコード設定を Image オブジェクトに保持するため、スレッドごとに別の Image を使う
+        return encode_output(img.copy(), FORMAT_EXTENSIONS[fmt], quality, target_kb, min_ssim, png_tolerance)
     
+    with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+        encoded = list(executor.map(encode, formats))
+    
+    return dict(zip(formats, encoded))
+
+
+def encode_outputs(
+    img: Image.Image,
+    suffix: str,
+    quality: int,
+    formats: Optional[list[str]] = None,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    png_tolerance: Optional[float] = None
+) -> dict:
+    """
+    formats 指定時は encode_formats、それ以外は encode_output でエンコード
+
     Returns:
-        処理結果の辞書
+        encode_output の戻り値（formats 指定時は主形式の値に "formats" を加えたもの）
+    """
+    if formats:
+        encoded = encode_formats(img, formats, quality, target_kb, min_ssim, png_tolerance)
+        return {**encoded[formats[0]], "formats": encoded}
+    
+    return encode_output(img, suffix, quality, target_kb, min_ssim, png_tolerance)
+
+
+def has_alpha(img: Image.Image) -> bool:
+    """透過情報を持つ画像か"""
+    return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def flatten_alpha(img: Image.Image, background: tuple[int, int, int] = (255, 255, 255)) -> Image.Image:
+    """透過部分を背景色で塗りつぶしたRGB画像を返す（透過がなければRGB変換のみ）"""
+    if has_alpha(img):
+        rgba = img.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, background)
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    return img.convert("RGB")
+
+
+def _preview_sample(img: Image.Image) -> Image.Image:
+    """平均色・BlurHash用に BLURHASH_SAMPLE_SIZE 四方に収まるよう平均で縮小したRGB画像（透過部分は白）"""
+    small = flatten_alpha(img)
+    small.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE), Image.Resampling.BOX)
+    return small
+
+
+def average_color(img: Image.Image) -> str:
+    """
+    平均色を #rrggbb で返す
+
+    一定の大きさ（_preview_sample）に縮小してから平均するため、同じ元画像なら出力の幅によらず同じ色になる。
+    """
+    r, g, b = (int(value + 0.5) for value in ImageStat.Stat(_preview_sample(img)).mean)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _base83(value: int, length: int) -> str:
+    """BlurHash用の83進数表記"""
+    return "".join(
+        BASE83_CHARACTERS[value // 83 ** (length - i - 1) % 83]
+        for i in range(length)
+    )
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(img: Image.Image, components: tuple[int, int] = BLURHASH_COMPONENTS) -> str:
+    """
+    BlurHash文字列を計算（https://blurha.sh の仕様）
+
+    BLURHASH_SAMPLE_SIZE まで縮小した画像から計算するため、元画像の大きさによらず軽い。
+    成分ごとの余弦の重み付き和は横・縦に分けて計算し、NumPyがあれば行列積で計算する。
+    """
+    x_components, y_components = components
+    small = _preview_sample(img)
+    width, height = small.size
+    
+    linear = [_srgb_to_linear(value) for value in range(256)]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+    
+    if NUMPY_AVAILABLE:
+        pixels = np.asarray(linear)[np.asarray(small)]
+        # sums[j, i, c] = Σ_y Σ_x cos_y[j][y] * cos_x[i][x] * pixels[y, x, c]
+        sums = np.einsum("jy,yxc,ix->jic", np.asarray(cos_y), pixels, np.asarray(cos_x))
+        sums = [[tuple(sums[j, i]) for i in range(x_components)] for j in range(y_components)]
+    else:
+        data = small.tobytes()
+        # 各行について横方向の成分ごとの和を先に求め、縦方向はその結果に重みをかける
+        rows = []
+        for y in range(height):
+            row = data[y * width * 3:(y + 1) * width * 3]
+            rows.append([
+                tuple(
+                    sum(weights[x] * linear[row[x * 3 + c]] for x in range(width))
+                    for c in range(3)
+                )
+                for weights in cos_x
+            ])
+        sums = [
+            [
+                tuple(sum(weights[y] * rows[y][i][c] for y in range(height)) for c in range(3))
+                for i in range(x_components)
+            ]
+            for weights in cos_y
+        ]
+    
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            factors.append(tuple(float(value) * scale for value in sums[j][i]))
+    
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+    
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    
+    def quantize(value: float) -> int:
+        scaled = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, int(scaled * 9 + 9.5)))
+    
+    for r, g, b in ac:
+        result += _base83(quantize(r) * 19 * 19 + quantize(g) * 19 + quantize(b), 2)
+    
+    return result
+
+
+def make_lqip(img: Image.Image) -> str:
+    """長辺 LQIP_SIZE ピクセルの低画質WebPを data URI で返す"""
+    small = img.copy()
+    small.thumbnail((LQIP_SIZE, LQIP_SIZE), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    encode_image(small, buffer, ".webp", LQIP_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_preview(img: Image.Image, size: tuple[int, int]) -> dict:
+    """
+    読み込み中に表示するプレビュー情報を作成
+
+    Args:
+        img: 元にする画像（出力のうち最も小さいものでよい）
+        size: 表示サイズ（主出力の幅・高さ）
+
+    Returns:
+        {"width", "height", "color", "blurhash", "lqip"}
+    """
+    return {
+        "width": size[0],
+        "height": size[1],
+        "color": average_color(img),
+        "blurhash": blurhash(img),
+        "lqip": make_lqip(img),
+    }
+
+
+def _hash_sample(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """知覚ハッシュ用にグレースケールで縮小した画像（透過部分は白）"""
+    return flatten_alpha(img).convert("L").resize(size, Image.Resampling.BOX)
+
+
+def _bits_to_hex(bits: Iterable[bool]) -> str:
+    value = 0
+    for bit in bits:
+        value = value << 1 | bool(bit)
+    return f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def dhash(img: Image.Image) -> str:
+    """
+    差分ハッシュ（dHash）を16進数で返す
+
+    横 HASH_SIZE + 1 ピクセルに縮小し、各行で右隣の方が明るいかを1ビットにする。
+    NumPyがあれば配列の比較1回で計算する。
+    """
+    sample = _hash_sample(img, (HASH_SIZE + 1, HASH_SIZE))
+    
+    if NUMPY_AVAILABLE:
+        pixels = np.asarray(sample, dtype=np.int16)
+        return _bits_to_hex((pixels[:, 1:] > pixels[:, :-1]).ravel())
+    
+    data = sample.tobytes()
+    width = HASH_SIZE + 1
+    return _bits_to_hex(
+        data[y * width + x + 1] > data[y * width + x]
+        for y in range(HASH_SIZE)
+        for x in range(HASH_SIZE)
+    )
+
+
+def phash(img: Image.Image) -> str:
+    """
+    知覚ハッシュ（pHash）を16進数で返す（要NumPy）
+
+    PHASH_SAMPLE_SIZE 四方に縮小して2次元DCTをかけ、低周波 HASH_SIZE 四方の係数が
+    中央値（直流成分を除く）より大きいかを1ビットにする。dHashより明るさ・コントラストの変化に強い。
+    """
+    n = PHASH_SAMPLE_SIZE
+    pixels = np.asarray(_hash_sample(img, (n, n)), dtype=np.float64)
+    
+    # DCT-II の基底行列（行 u が周波数 u の余弦）
+    k = np.arange(n)
+    basis = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    low = (basis @ pixels @ basis.T)[:HASH_SIZE, :HASH_SIZE]
+    
+    median = np.median(low.ravel()[1:])
+    return _bits_to_hex((low > median).ravel())
+
+
+def hash_distance(a: str, b: str) -> int:
+    """知覚ハッシュのハミング距離（異なるビット数）"""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+# 類似画像の検出に使える知覚ハッシュ（phash は要NumPy）
+PERCEPTUAL_HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+
+# アニメーションとして扱う形式（MPO・TIFFなどの複数ページ画像は先頭だけの静止画として扱う）
+ANIMATED_FORMATS = ("GIF", "WEBP", "PNG")
+
+
+def is_animated(img: Image.Image) -> bool:
+    """複数フレームのアニメーション画像（GIF・WebP・APNG）か"""
+    return img.format in ANIMATED_FORMATS and getattr(img, "n_frames", 1) > 1
+
+
+def load_frames(
+    img: Image.Image,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+    reducing_gap: Optional[float] = None
+) -> tuple[list[Image.Image], list[int]]:
+    """
+    アニメーションの全フレームを1回ずつデコードして出力サイズに縮小し、直前と同じ内容のフレームをまとめる
+
+    フレームはデコードした直後に縮小するため、元のサイズで持つのは常に1フレームだけで、
+    残りのメモリはフレーム数×出力サイズ分になる。
+
+    Returns:
+        (RGBAのフレーム, 各フレームの表示時間（ミリ秒、まとめたフレームの分を含む）)
+    """
+    frames = []
+    durations = []
+    previous = None
+    
+    for frame in ImageSequence.Iterator(img):
+        rgba = resize_image(frame.convert("RGBA"), max_width, max_height, reducing_gap)
+        # WebPはデコードするまで表示時間が入らないため、変換（デコード）の後に読む
+        duration = frame.info.get("duration", 0)
+        digest = hashlib.blake2b(rgba.tobytes(), digest_size=16).digest()
+        if digest == previous:
+            durations[-1] += duration
+            continue
+        
+        previous = digest
+        frames.append(rgba)
+        durations.append(duration)
+    
+    img.seek(0)
+    return frames, durations
+
+
+def encode_animation(frames: list[Image.Image], durations: list[int], quality: int, loop: int = 0) -> dict:
+    """
+    同じサイズのフレームをアニメーションWebPにエンコード
+
+    Returns:
+        {"data", "bytes", "width", "height", "frames"}（"frames" は出力したフレーム数）
+    """
+    first = frames[0]
+    buffer = io.BytesIO()
+    first.save(
+        buffer,
+        "WEBP",
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=loop,
+        quality=quality,
+        # フレームごとに非可逆・可逆の小さい方を選ばせる（図形的なアニメーションで効く）
+        allow_mixed=True
+    )
+    data = buffer.getvalue()
+    
+    return {
+        "data": data,
+        "bytes": len(data),
+        "width": first.width,
+        "height": first.height,
+        "frames": len(frames),
+    }
+
+
+def open_source(source) -> tuple[Image.Image, int]:
+    """
+    bytes・bytearray・memoryview、ファイルオブジェクト、パスから画像を開く
+
+    bytes はコピーせずに読み込む（bytearray・memoryview は読み込み用に1回コピーされる）。
+    シークできないファイルオブジェクト（ソケットなど）は全体を読み込んでから開く。
+
+    Returns:
+        (画像, 元データのバイト数)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        size = memoryview(source).nbytes
+        return Image.open(io.BytesIO(source)), size
+    
+    if isinstance(source, (str, Path)):
+        return Image.open(source), os.path.getsize(source)
+    
+    if not source.seekable():
+        source = io.BytesIO(source.read())
+    start = source.tell()
+    size = source.seek(0, io.SEEK_END) - start
+    source.seek(start)
+    return Image.open(source), size
+
+
+def transform_image(
+    source,
+    suffix: str = ".webp",
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+    quality: int = 85,
+    reducing_gap: Optional[float] = None,
+    widths: Optional[list[int]] = None,
+    formats: Optional[list[str]] = None,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    preview: bool = False,
+    memory_mb: Optional[int] = None,
+    perceptual_hash: Optional[str] = None,
+    png_tolerance: Optional[float] = None,
+    timings: Optional[dict] = None
+) -> dict:
+    """
+    画像をメモリ上で変換し、エンコード結果とメタデータを返す（ファイルの読み書きはしない）
+
+    アップロードを受け取るサービスなどから一時ファイルなしで使える。process_image はこれを呼び、
+    結果をファイルに書き込むだけのラッパー。
+
+    Args:
+        source: 元画像（bytes などのバッファ、ファイルオブジェクト、パス。open_source 参照）
+        suffix: 出力形式の拡張子（例: ".webp"。formats 指定時は使わない）
+        max_width: 最大幅
+        max_height: 最大高さ
+        quality: 画像品質
+        reducing_gap: 縮小デコード・整数縮小の倍率（None なら全画素から処理。resize_image・draft_image 参照）
+        widths: srcset用に生成する幅のリスト（指定時は max_width の代わりに使い、大きい幅から順に前の結果を縮小）
+        formats: 出力形式のリスト（指定時は suffix の代わりに先頭を主形式とし、encode_formats でエンコード）
+        target_kb: 目標ファイルサイズ（KB、quality を上限に品質を探索。search_quality 参照）
+        min_ssim: SSIMの下限（quality を上限に、これを満たす最も低い品質を探索。search_ssim_quality 参照）
+        preview: LQIP・BlurHash・平均色を作るか（make_preview）
+        memory_mb: 1枚の処理に使うメモリの上限（MB、estimate_memory で見積もり、超えるJPEGは縮小デコードし、それでも超えればエラー）
+        perceptual_hash: 最も小さい出力から計算する知覚ハッシュ（PERCEPTUAL_HASH_FUNCTIONS のキー）
+        png_tolerance: 指定するとPNGの出力を最適化し、減色はこの誤差まで許す（optimize_png）
+        timings: 指定時は段階（PROFILE_STAGES）ごとの処理時間（秒）を加算する
+
+    出力は result["files"] に「出力名の語幹に続く部分 → エンコード結果」で入る
+    （".webp"、widths 指定時は "-480.webp"、formats 指定時は形式ごと）。
+    result["variants"]・result["formats"] の "path" にもこの名前が入る。
+    主出力（最大の幅・先頭の形式）は result["data"] でも参照できる（同じオブジェクトでコピーしない）。
+
+    アニメーションGIF・WebPをWebPで出力する場合は、全フレームを同じサイズに縮小して
+    アニメーションWebPにする（load_frames・encode_animation）。formats・target_kb・min_ssim は指定できない。
+
+    Returns:
+        {"data", "mime", "suffix", "width", "height", "source", "files", "action", ...}
+        （"source" は元画像の {"width", "height", "format", "bytes"}。ほかに設定に応じて
+        "variants"・"formats"・"quality"・"over_target"・"ssim"・"bytes_saved"・"png"・"frames"・"preview"・"perceptual_hash"）
+
+    Raises:
+        開けない画像・メモリ上限を超える画像など、処理できない場合は例外
+    """
+    if formats:
+        suffix = FORMAT_EXTENSIONS[formats[0]]
+    # 出力名は指定された拡張子のまま使い、形式の判定は小文字で行う
+    extension = suffix.lower()
+    
+    result = {"suffix": suffix, "mime": Image.MIME.get(Image.registered_extensions().get(extension)), "action": []}
+    files = {}
+    
+    def store(encoded: dict, base: str, extension: str) -> dict:
+        # エンコード結果を files に移し、"data" を出力名（"path"）に置き換える
+        name = base + extension
+        files[name] = encoded["data"]
+        stored = {"path": name, **{key: value for key, value in encoded.items() if key != "data"}}
+        if "formats" in stored:
+            stored["formats"] = {
+                fmt: store(saved, base, FORMAT_EXTENSIONS[fmt])
+                for fmt, saved in stored["formats"].items()
+            }
+        return stored
+    
+    # メモリ上限がある場合は、全画素からのリサイズで大きな作業領域を作らない
+    if memory_mb and not reducing_gap:
+        reducing_gap = DEFAULT_REDUCING_GAP
+    
+    with measure(timings, "open"):
+        img, source_bytes = open_source(source)
+    
+    with img:
+        original_size = img.size
+        result["source"] = {"width": img.width, "height": img.height, "format": img.format, "bytes": source_bytes}
+        webp_converted = extension == ".webp" and img.format != "WEBP"
+        
+        # 生成する幅（srcset指定時は最大の幅）を基準にサイズを決定
+        ladder = srcset_widths(original_size[0], widths) if widths else [max_width]
+        target_size = calc_resize_size(*original_size, ladder[0], max_height)
+        
+        # アニメーションGIF・WebPは全フレームをアニメーションWebPで出力
+        if is_animated(img) and (formats or extension == ".webp"):
+            if formats:
+                raise ValueError("アニメーション画像には --formats を指定できません（アニメーションWebPで出力する場合は指定しないでください）")
+            if target_kb or min_ssim:
+                raise ValueError("アニメーション画像には --target-kb・--min-ssim を指定できません")
+            
+            # 元のサイズで持つのはデコード中の1フレームだけで、残りは全フレームを出力サイズで持つ
+            budget = memory_mb * 1024 * 1024 if memory_mb else None
+            if budget:
+                needed = decoded_bytes(original_size, "RGBA") + decoded_bytes(target_size, "RGBA") * img.n_frames
+                if needed > budget:
+                    raise MemoryError(
+                        f"処理に必要なメモリ（約{needed / 1024 / 1024:.0f}MB、{img.width}x{img.height}、"
+                        f"{img.n_frames}フレーム）が上限（{memory_mb}MB）を超えます"
+                    )
+            
+            with measure(timings, "decode"):
+                frames, durations = load_frames(img, ladder[0], max_height, reducing_gap or None)
+            
+            outputs = []
+            # 大きい幅から順に、直前の結果を縮小して各幅を生成
+            for width in ladder:
+                size = calc_resize_size(*original_size, width, max_height)
+                if outputs and outputs[-1]["width"] == size[0]:
+                    continue
+                with measure(timings, "resize"):
+                    frames = [
+                        resize_image(frame, width, max_height, reducing_gap=reducing_gap or None, source_size=original_size)
+                        for frame in frames
+                    ]
+                with measure(timings, "encode"):
+                    encoded = encode_animation(frames, durations, quality, img.info.get("loop", 0))
+                outputs.append(store(encoded, f"-{size[0]}" if widths else "", suffix))
+            
+            new_size = (outputs[0]["width"], outputs[0]["height"])
+            output_bytes = sum(saved["bytes"] for saved in outputs)
+            if widths:
+                result["variants"] = outputs
+                result["action"].append(f"srcset: {', '.join(str(saved['width']) for saved in outputs)}w")
+            else:
+                result["bytes"] = output_bytes
+                if original_size != new_size:
+                    result["action"].append(f"リサイズ: {original_size[0]}x{original_size[1]} → {new_size[0]}x{new_size[1]}")
+            if webp_converted:
+                result["action"].append("WebP変換")
+            
+            result["frames"] = {"source": img.n_frames, "output": len(frames)}
+            result["bytes_saved"] = source_bytes - output_bytes
+            result["action"].append(
+                f"アニメーション: {img.n_frames} → {len(frames)}フレーム"
+                f"（{source_bytes / 1024:.0f}KB → {output_bytes / 1024:.0f}KB）"
+            )
+            
+            if preview:
+                # 先頭フレームの最も小さい出力から作る
+                with measure(timings, "preview"):
+                    result["preview"] = make_preview(frames[0], new_size)
+                result["action"].append(f"プレビュー: {result['preview']['color']}")
+            
+            if perceptual_hash:
+                result["perceptual_hash"] = PERCEPTUAL_HASH_FUNCTIONS[perceptual_hash](frames[0])
+            
+            result["width"], result["height"] = new_size
+            result["data"] = files[outputs[0]["path"]]
+            result["files"] = files
+            return result
+        
+        convert = not has_alpha(img) and img.mode != "RGB"
+        
+        # メモリ上限を超えそうなJPEGは、目標サイズぎりぎりまで縮小デコード
+        draft_gap = reducing_gap
+        budget = memory_mb * 1024 * 1024 if memory_mb else None
+        if budget and estimate_memory(img.size, img.mode, target_size, convert) > budget:
+            draft_gap = 1.0
+        
+        # JPEGは目標サイズに近い解像度で直接デコード
+        draft_scale = draft_image(img, target_size, draft_gap)
+        if draft_scale:
+            result["action"].append(f"縮小デコード: 1/{draft_scale}")
+        
+        if budget:
+            needed = estimate_memory(img.size, img.mode, target_size, convert)
+            if needed > budget:
+                raise MemoryError(
+                    f"処理に必要なメモリ（約{needed / 1024 / 1024:.0f}MB、{img.width}x{img.height}）が"
+                    f"上限（{memory_mb}MB）を超えます"
+                )
+        
+        with measure(timings, "decode"):
+            img.load()
+        
+        # アルファチャンネルを持つ画像はそのまま処理し、それ以外はRGBに変換
+        if convert:
+            with measure(timings, "convert"):
+                converted = img.convert("RGB")
+            # 変換前の画像はもう使わないため、すぐに解放する
+            img.close()
+            img = converted
+            result["action"].append("RGB変換")
+        
+        if widths:
+            # 大きい幅から順に、直前の結果を縮小して各幅を生成
+            result["variants"] = []
+            resized_img = img
+            
+            for width in ladder:
+                previous = resized_img
+                with measure(timings, "resize"):
+                    resized_img = resize_image(
+                        previous,
+                        width,
+                        max_height,
+                        reducing_gap=reducing_gap or None,
+                        source_size=original_size
+                    )
+                # 次の幅は直前の結果から作るため、それより前の画像は解放する
+                if previous is not resized_img:
+                    previous.close()
+                if result["variants"] and result["variants"][-1]["width"] == resized_img.width:
+                    continue
+                
+                with measure(timings, "encode"):
+                    encoded = encode_outputs(resized_img, suffix, quality, formats, target_kb, min_ssim, png_tolerance)
+                saved = store(encoded, f"-{resized_img.width}", suffix)
+                result["variants"].append({
+                    "path": saved.pop("path"),
+                    "width": resized_img.width,
+                    "height": resized_img.height,
+                    **saved,
+                })
+            
+            generated = ", ".join(str(variant["width"]) for variant in result["variants"])
+            result["action"].append(f"srcset: {generated}w")
+            
+            if webp_converted and not formats:
+                result["action"].append("WebP変換")
+            
+            result["width"] = result["variants"][0]["width"]
+            result["height"] = result["variants"][0]["height"]
+            result["data"] = files[result["variants"][0]["path"]]
+        else:
+            # リサイズ
+            with measure(timings, "resize"):
+                resized_img = resize_image(
+                    img,
+                    max_width,
+                    max_height,
+                    reducing_gap=reducing_gap or None,
+                    source_size=original_size
+                )
+            if resized_img is not img:
+                img.close()
+            new_size = resized_img.size
+            
+            if original_size != new_size:
+                result["action"].append(f"リサイズ: {original_size[0]}x{original_size[1]} → {new_size[0]}x{new_size[1]}")
+            
+            if webp_converted and not formats:
+                result["action"].append("WebP変換")
+            
+            # エンコード
+            with measure(timings, "encode"):
+                encoded = encode_outputs(resized_img, suffix, quality, formats, target_kb, min_ssim, png_tolerance)
+            saved = store(encoded, "", suffix)
+            result["bytes"] = saved["bytes"]
+            for key in ("quality", "over_target", "ssim", "bytes_saved", "png"):
+                if key in saved:
+                    result[key] = saved[key]
+            if "ssim" in saved and "formats" not in saved:
+                result["action"].append(f"品質: {saved['quality']}（SSIM {saved['ssim']:.4f}、{saved['bytes_saved'] / 1024:.0f}KB削減）")
+            elif "quality" in saved and "formats" not in saved:
+                result["action"].append(f"品質: {saved['quality']}（目標 {target_kb}KB → {saved['bytes'] / 1024:.0f}KB）")
+            if "png" in saved and "formats" not in saved:
+                result["action"].append(f"PNG: {describe_png(saved['png'])}")
+            if "formats" in saved:
+                result["formats"] = saved["formats"]
+            
+            result["width"], result["height"] = new_size
+            result["data"] = files[saved["path"]]
+        
+        if "formats" in result:
+            sizes = ", ".join(
+                f"{fmt} {saved['bytes'] / 1024:.0f}KB"
+                + (f" q{saved['quality']}" if "quality" in saved else "")
+                + (f" SSIM {saved['ssim']:.4f}" if "ssim" in saved else "")
+                + (f"（{describe_png(saved['png'])}）" if "png" in saved else "")
+                for fmt, saved in result["formats"].items()
+            )
+            result["action"].append(f"形式: {sizes}")
+        elif formats:
+            result["action"].append(f"形式: {', '.join(formats)}")
+        
+        # 下限品質でも目標サイズに収まらなかった出力は、成功扱いのまま警告する
+        over_target = [
+            name for name, data in files.items()
+            if name[name.rfind("."):].lower() in LOSSY_EXTENSIONS and len(data) > target_kb * 1024
+        ] if target_kb else []
+        if over_target:
+            result["over_target"] = True
+            sizes = ", ".join(
+                (f"{name} " if len(files) > 1 else "") + f"{len(files[name]) / 1024:.0f}KB"
+                for name in over_target
+            )
+            result["action"].append(f"警告: 目標 {target_kb}KB を超過（{sizes}）")
+        
+        if preview:
+            # 最も小さい出力から作り、表示サイズは主出力（最大の幅）のものを記録
+            with measure(timings, "preview"):
+                result["preview"] = make_preview(resized_img, (result["width"], result["height"]))
+            result["action"].append(f"プレビュー: {result['preview']['color']}")
+        
+        if perceptual_hash:
+            result["perceptual_hash"] = PERCEPTUAL_HASH_FUNCTIONS[perceptual_hash](resized_img)
+    
+    result["files"] = files
+    return result
+
+
+def write_outputs(files: dict, output_path: Path, fingerprint: bool = False) -> dict[str, str]:
+    """
+    transform_image の出力（result["files"]）を output_path の語幹に名前を続けたパスに書き込む
+
+    fingerprint を指定すると、内容ハッシュ入りの名前（name.<hash8>.webp）で書き込む。
+    ハッシュはメモリ上のデータから計算するため、書き込んだファイルを読み直さない。
+
+    Returns:
+        {出力名: 書き込んだパス}
+    """
+    paths = {}
+    
+    for name, data in files.items():
+        path = output_path.with_name(output_path.stem + name)
+        if fingerprint:
+            digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+            path = path.with_name(f"{path.stem}.{digest}{path.suffix}")
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        break_link(path)
+        path.write_bytes(data)
+        paths[name] = str(path)
+    
+    return paths
+
+
+def write_result(result: dict, fingerprint: bool = False) -> dict:
+    """
+    process_image(write=False) の結果のエンコード結果（result["files"]）を書き込む
+
+    result["variants"]・result["formats"] の出力名を書き込んだパスに置き換え、
+    fingerprint 指定時は論理名と書き込んだパスの対応を result["assets"] に記録する。
+    """
+    output_path = Path(result["output"])
+    paths = write_outputs(result.pop("files"), output_path, fingerprint)
+    
+    for key in ("variants", "formats"):
+        if key in result:
+            result[key] = _map_paths(result[key], lambda name: paths[name])
+    
+    if fingerprint:
+        result["assets"] = [
+            {"name": output_path.with_name(output_path.stem + name).name, "path": path}
+            for name, path in paths.items()
+        ]
+        result["action"].append(f"フィンガープリント: {Path(result['assets'][0]['path']).name}")
+    
+    if not result["action"]:
+        result["action"].append("処理なし（変更不要）")
+    
+    return result
+
+
+def process_image(
+    input_path: Path,
+    output_path: Path,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+    convert_to_webp: bool = True,
+    quality: int = 85,
+    reducing_gap: Optional[float] = None,
+    widths: Optional[list[int]] = None,
+    formats: Optional[list[str]] = None,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    preview: bool = False,
+    memory_mb: Optional[int] = None,
+    fingerprint: bool = False,
+    perceptual_hash: Optional[str] = None,
+    png_tolerance: Optional[float] = None,
+    profile: bool = False,
+    source=None,
+    write: bool = True
+) -> dict:
+    """
+    単一画像を処理
+    
+    変換は transform_image でメモリ上で行い、その結果を write_result で書き込む。
+    source を指定すると input_path を読まずにこれを変換し、write が False なら書き込まずに
+    エンコード結果を result["files"] に残す。convert_to_webp が False なら output_path の形式で出力し、
+    fingerprint は write_result に渡す。その他の引数は transform_image を参照。
+    memory_mb・profile 指定時は、この画像の処理中のピークRSS（MB）も記録する。
+
+    Returns:
+        処理結果の辞書
+    """
+    result = {
+        "input": str(input_path),
+        "output": str(output_path),
+        "success": False,
+        "action": [],
+    }
+    
+    suffix = input_path.suffix.lower()
+    
+    # SVGなどはそのままコピー
+    if suffix in COPY_EXTENSIONS:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        break_link(output_path)
+        shutil.copy2(input_path, output_path)
+        result["success"] = True
+        result["action"].append("コピー（変換なし）")
+        return result
+    
+    # 画像ファイルでなければスキップ
+    if suffix not in IMAGE_EXTENSIONS:
+        result["action"].append("スキップ（非対応形式）")
+        return result
+    
+    if not PIL_AVAILABLE:
+        result["action"].append("エラー: Pillowがインストールされていません")
+        return result
+    
+    timings = {} if profile else None
+    if profile or memory_mb:
+        reset_peak_rss()
+    
+    out_suffix = ".webp" if convert_to_webp else output_path.suffix
+    
+    try:
+        transformed = transform_image(
+            input_path if source is None else source,
+            out_suffix,
+            max_width,
+            max_height,
+            quality,
+            reducing_gap,
+            widths,
+            formats,
+            target_kb,
+            min_ssim,
+            preview,
+            memory_mb,
+            perceptual_hash,
+            png_tolerance,
+            timings
+        )
+        
+        if output_path.suffix != transformed["suffix"]:
+            output_path = output_path.with_suffix(transformed["suffix"])
+            result["output"] = str(output_path)
+        
+        # メモリ上の結果だけにあるキーは記録しない
+        for key in ("data", "mime", "suffix", "width", "height", "source"):
+            transformed.pop(key)
+        result["action"].extend(transformed.pop("action"))
+        result.update(transformed)
+        
+        if write:
+            write_result(result, fingerprint)
+        result["success"] = True
+    
+    except UnidentifiedImageError:
+        # source（読み込み済みのデータ）から開いた場合も、パスから開いた場合と同じくパスを表示する
+        result["action"].append(f"エラー: cannot identify image file {str(input_path)!r}")
+    
+    except Exception as e:
+        result["action"].append(f"エラー: {e}")
+    
+    finally:
+        if memory_mb:
+            peak = peak_rss_mb()
+            if peak is not None:
+                result["peak_rss_mb"] = round(peak, 1)
+                result["action"].append(f"ピークRSS: {peak:.0f}MB")
+        
+        if timings is not None:
+            result["profile"] = {
+                "stages": {stage: round(seconds, 6) for stage, seconds in timings.items()},
+                "total": round(sum(timings.values()), 6),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+    
+    return result
+
+
+def file_hash(path: Path) -> str:
+    """ファイル内容のSHA-256ハッシュを取得"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_cache(output_dir: Path) -> dict:
+    """
+    出力ディレクトリのキャッシュマニフェストを読み込む
+
+    entries は「出力先（出力ディレクトリからの相対パス）→ 元画像ハッシュと処理設定」の辞書。
+    読み込めない・バージョン違いの場合は空のキャッシュを返す。
+    """
+    cache = {"root": output_dir, "entries": {}}
+    cache_path = output_dir / CACHE_FILENAME
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return cache
+
+    if data.get("version") == CACHE_VERSION:
+        cache["entries"] = data.get("entries", {})
+
+    return cache
+
+
+def save_cache(cache: dict) -> None:
+    """キャッシュマニフェストを書き込む（途中で中断しても壊れないよう置き換えで保存）"""
+    output_dir = cache["root"]
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    cache_path = output_dir / CACHE_FILENAME
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "entries": cache["entries"]}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, cache_path)
+
+
+def _relative_to(path: str | Path, root: Path) -> str:
+    """root からの相対パス（区切りは / で統一）"""
+    return Path(os.path.relpath(path, root)).as_posix()
+
+
+def _map_paths(value, convert):
+    """結果に含まれる "path" の値をすべて convert で変換した複製を返す"""
+    if isinstance(value, dict):
+        return {
+            key: convert(item) if key == "path" else _map_paths(item, convert)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_map_paths(item, convert) for item in value]
+    return value
+
+
+def _collect_paths(value) -> list[str]:
+    """結果に含まれる "path" の値をすべて集める"""
+    if isinstance(value, dict):
+        return [
+            path
+            for key, item in value.items()
+            for path in ([item] if key == "path" else _collect_paths(item))
+        ]
+    if isinstance(value, list):
+        return [path for item in value for path in _collect_paths(item)]
+    return []
+
+
+def _entry_files(entry: dict, root: Path) -> list[Path]:
+    """キャッシュエントリが指す出力ファイルの一覧"""
+    details = {key: entry[key] for key in OUTPUT_DETAIL_KEYS if key in entry}
+    return [root / path for path in _collect_paths(details) or [entry["output"]]]
+
+
+def _cache_id(cache: dict, task: dict) -> str:
+    """タスクのキャッシュエントリ名（出力ディレクトリからの相対パス）"""
+    return _relative_to(task["output_path"], cache["root"])
+
+
+def _cache_params(task: dict) -> dict:
+    """キャッシュキーに含める処理設定（入出力パス以外の引数すべて）"""
+    return {
+        key: value for key, value in sorted(task.items())
+        if key not in ("input_path", "output_path", "profile")
+    }
+
+
+def lookup_cache(cache: dict, task: dict, source_hash: str) -> Optional[dict]:
+    """
+    元画像と処理設定が前回と同じで、出力も残っていればキャッシュ済みの結果を返す
+
+    Returns:
+        キャッシュヒット時は処理結果の辞書、それ以外は None
+    """
+    entry = cache["entries"].get(_cache_id(cache, task))
+    if entry is None:
+        return None
+
+    if entry.get("source") != source_hash or entry.get("params") != _cache_params(task):
+        return None
+
+    if not all(path.exists() for path in _entry_files(entry, cache["root"])):
+        return None
+
+    result = {
+        "input": str(task["input_path"]),
+        "output": str(cache["root"] / entry["output"]),
+        "success": True,
+        "cached": True,
+        "action": ["キャッシュ（変更なし）"],
+    }
+
+    for key in OUTPUT_DETAIL_KEYS:
+        if key in entry:
+            result[key] = _map_paths(entry[key], lambda path: str(cache["root"] / path))
+
+    return result
+
+
+def update_cache(cache: dict, task: dict, source_hash: str, result: dict) -> None:
+    """処理に成功したタスクをキャッシュに記録"""
+    entry = {
+        "input": str(task["input_path"]),
+        "source": source_hash,
+        "params": _cache_params(task),
+        "output": _relative_to(result["output"], cache["root"]),
+    }
+
+    for key in OUTPUT_DETAIL_KEYS:
+        if key in result:
+            entry[key] = _map_paths(result[key], lambda path: _relative_to(path, cache["root"]))
+
+    cache["entries"][_cache_id(cache, task)] = entry
+
+
+def collect_stale(cache: dict, tasks: list[dict]) -> list[dict]:
+    """
+    今回の処理対象に含まれない出力（元画像が削除・改名されたもの）を報告用の結果として返す
+
+    出力ファイル自体が既に無いエントリはキャッシュから取り除く。
+    """
+    current = {_cache_id(cache, task) for task in tasks}
+    results = []
+
+    for cache_id, entry in list(cache["entries"].items()):
+        if cache_id in current:
+            continue
+
+        if not any(path.exists() for path in _entry_files(entry, cache["root"])):
+            del cache["entries"][cache_id]
+            continue
+
+        results.append({
+            "input": entry["input"],
+            "output": str(cache["root"] / entry["output"]),
+            "success": False,
+            "stale": True,
+            "action": ["古い出力（元画像が処理対象外）"],
+        })
+
+    return results
+
+
+def _process_task(task: dict) -> dict:
+    """プロセスプールから呼び出す process_image のラッパー"""
+    return process_image(**task)
+
+
+def link_duplicate(original: dict, task: dict) -> dict:
+    """
+    内容が同じ元画像の処理結果から、重複した元画像（task）の出力をハードリンクで作る
+
+    出力名は original の出力名の語幹を task の出力名の語幹に置き換えたもの
+    （hero.webp・hero-480.webp → copy.webp・copy-480.webp）。
+    ハードリンクできない（別ファイルシステムなど）場合はコピーする。
+
+    Returns:
+        処理結果の辞書（"duplicate_of" に original の入力パス）
+    """
+    result = {
+        "input": str(task["input_path"]),
+        "output": str(task["output_path"]),
+        "success": False,
+        "duplicate_of": original["input"],
+        "action": [],
+    }
+    source_name = Path(original["input"]).name
+    
+    if not original["success"]:
+        result["action"].append(f"エラー: 同じ内容の {source_name} の処理に失敗しました")
+        return result
+    
+    source_stem = Path(original["output"]).stem
+    target = Path(task["output_path"])
+    
+    def rename(path: str) -> str:
+        return str(target.with_name(target.stem + Path(path).name[len(source_stem):]))
+    
+    details = {key: original[key] for key in OUTPUT_DETAIL_KEYS if key in original}
+    
+    try:
+        for path in dict.fromkeys(_collect_paths(details) or [original["output"]]):
+            link_path = Path(rename(path))
+            link_path.parent.mkdir(parents=True, exist_ok=True)
+            link_path.unlink(missing_ok=True)
+            try:
+                os.link(path, link_path)
+            except OSError:
+                shutil.copy2(path, link_path)
+    except OSError as e:
+        result["action"].append(f"エラー: {e}")
+        return result
+    
+    result["output"] = rename(original["output"])
+    for key, value in details.items():
+        result[key] = _map_paths(value, rename)
+    if "assets" in result:
+        for asset in result["assets"]:
+            asset["name"] = target.stem + asset["name"][len(source_stem):]
+    
+    result["success"] = True
+    result["action"].append(f"重複: {source_name} と同じ内容（出力をリンク）")
+    return result
+
+
+def find_similar(results: Iterable[dict], threshold: int) -> list[dict]:
+    """
+    知覚ハッシュの距離が threshold 以下の組（内容は違うが見た目の近い画像）を報告用の結果として返す
+
+    results は "perceptual_hash" を記録した処理結果。重複としてリンクしたものは除く。
+    単色など明暗の差がない画像はハッシュのビットがすべて0になり、互いに距離0になってしまうため比較しない。
+    """
+    hashed = sorted(
+        (result for result in results
+         if result["success"] and int(result.get("perceptual_hash", "0"), 16) and "duplicate_of" not in result),
+        key=lambda result: result["index"]
+    )
+    reports = []
+    
+    for i, result in enumerate(hashed):
+        for other in hashed[i + 1:]:
+            distance = hash_distance(result["perceptual_hash"], other["perceptual_hash"])
+            if distance <= threshold:
+                reports.append({
+                    "input": result["input"],
+                    "output": result["output"],
+                    "success": False,
+                    "similar": True,
+                    "similar_to": other["input"],
+                    "distance": distance,
+                    "action": [f"類似: {Path(other['input']).name}（距離 {distance}）"],
+                })
+    
+    return reports
+
+
+def _check_cache(
+    cache: Optional[dict],
+    task: dict,
+    source_hashes: Optional[dict[Path, str]] = None
+) -> tuple[Optional[dict], Optional[str]]:
+    """
+    キャッシュを確認（source_hashes に計算済みの元画像のハッシュがあれば読み直さない）
+
+    Returns:
+        (キャッシュヒット時の結果, 元画像のハッシュ)。キャッシュ対象外・元画像を読めない場合は (None, None)
+    """
+    if cache is None or task["input_path"].suffix.lower() not in IMAGE_EXTENSIONS | COPY_EXTENSIONS:
+        return None, None
+    
+    try:
+        source_hash = (source_hashes or {}).get(task["input_path"]) or file_hash(task["input_path"])
+    except OSError:
+        # 走査後に削除・移動された画像は、処理（process_image）でその画像だけのエラーにする
+        return None, None
+    return lookup_cache(cache, task, source_hash), source_hash
+
+
+def iter_tasks(
+    tasks: Iterable[dict],
+    jobs: int = 1,
+    cache: Optional[dict] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    pipeline_mb: Optional[int] = None,
+    source_hashes: Optional[dict[Path, str]] = None
+) -> Iterator[tuple[int, dict]]:
+    """
+    process_image の引数辞書を順に処理し、(tasks 内の番号, 処理結果) を返すジェネレータ
+
+    jobs が2以上ならプロセスプールで並列処理し、完了した順に返す（逐次処理では入力順）。
+    処理待ちのタスクは jobs の2倍までに抑え、tasks はジェネレータでもよい。
+    pipeline_mb を指定すると、読み込み・変換・書き込みを重ねて実行する（iter_tasks_pipelined）。
+
+    Args:
+        tasks: process_image のキーワード引数の辞書
+        jobs: 並列数（1以下なら逐次処理）
+        cache: load_cache で読み込んだキャッシュ（指定時は変更のない画像をスキップ）
+        executor: 使い回すプロセスプール（指定時は新しく作らず、終了もしない）
+        pipeline_mb: パイプラインで同時に扱う元画像のバイト数の上限（MB、None なら使わない）
+        source_hashes: 計算済みの元画像のハッシュ（入力パス → SHA-256、キャッシュの確認で読み直さない）
+    """
+    if pipeline_mb:
+        yield from iter_tasks_pipelined(tasks, jobs, cache, executor, pipeline_mb, source_hashes)
+        return
+    
+    def record(task: dict, source_hash: Optional[str], result: dict) -> dict:
+        if source_hash is not None and result["success"]:
+            update_cache(cache, task, source_hash, result)
+        return result
+    
+    if executor is None and jobs <= 1:
+        for i, task in enumerate(tasks):
+            cached, source_hash = _check_cache(cache, task, source_hashes)
+            yield i, cached or record(task, source_hash, _process_task(task))
+        return
+    
+    with nullcontext(executor) if executor else ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = {}
+        
+        def finished(block: bool) -> Iterator[tuple[int, dict]]:
+            done, _ = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, task, source_hash = in_flight.pop(future)
+                yield i, record(task, source_hash, future.result())
+        
+        for i, task in enumerate(tasks):
+            cached, source_hash = _check_cache(cache, task, source_hashes)
+            if cached:
+                yield i, cached
+                continue
+            
+            in_flight[executor.submit(_process_task, task)] = (i, task, source_hash)
+            yield from finished(block=len(in_flight) >= jobs * 2)
+        
+        while in_flight:
+            yield from finished(block=True)
+
+
+class ByteBudget:
+    """
+    パイプラインで同時に扱う元画像のバイト数の上限（asyncio用）
+
+    上限より大きい画像も、ほかに扱っている画像がなければ通す。
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._condition = asyncio.Condition()
+    
+    async def acquire(self, size: int) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+    
+    async def release(self, size: int) -> None:
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+def _transform_task(task: dict, data: bytes) -> dict:
+    """プロセスプールから呼び出す、読み込み済みの元画像を書き込まずに処理するラッパー"""
+    return process_image(**task, source=data, write=False)
+
+
+async def _run_pipeline(
+    tasks: Iterable[dict],
+    jobs: int,
+    cache: Optional[dict],
+    executor: Optional[ProcessPoolExecutor],
+    max_bytes: int,
+    emit,
+    source_hashes: Optional[dict[Path, str]] = None
+) -> None:
+    """
+    読み込み → 変換 → 書き込みの3段を非同期に並行して実行する（iter_tasks_pipelined 参照）
+
+    読み込みと書き込みはスレッド、変換はプロセスプールで行い、段の間のキューは jobs の2倍までに抑える。
+    """
+    loop = asyncio.get_running_loop()
+    budget = ByteBudget(max_bytes)
+    decode_queue = asyncio.Queue(maxsize=jobs * 2)
+    write_queue = asyncio.Queue(maxsize=jobs * 2)
+    
+    async def read() -> None:
+        iterator = iter(tasks)
+        for i in itertools.count():
+            # ディレクトリの走査もブロックするため、スレッドで次のタスクを取り出す
+            task = await loop.run_in_executor(io_pool, next, iterator, None)
+            if task is None:
+                break
+            
+            if task["input_path"].suffix.lower() not in IMAGE_EXTENSIONS:
+                # コピー・スキップは変換しないため、キャッシュの確認も含めて読み込み用のスレッドで済ませる
+                cached, source_hash = await loop.run_in_executor(io_pool, _check_cache, cache, task, source_hashes)
+                result = cached or await loop.run_in_executor(io_pool, _process_task, task)
+                if source_hash is not None and result["success"] and not cached:
+                    update_cache(cache, task, source_hash, result)
+                emit(i, result)
+                continue
+            
+            try:
+                size = await loop.run_in_executor(io_pool, os.path.getsize, task["input_path"])
+            except OSError as e:
+                # 走査の後に消えた・読めなくなった元画像は、その画像だけエラーにして続ける
+                emit(i, {**_failed_result(task), "action": [f"エラー: {e}"]})
+                continue
+            await budget.acquire(size)
+            try:
+                data = await loop.run_in_executor(io_pool, task["input_path"].read_bytes)
+            except OSError as e:
+                await budget.release(size)
+                emit(i, {**_failed_result(task), "action": [f"エラー: {e}"]})
+                continue
+            
+            # キャッシュの確認は計算済みのハッシュか読み込んだデータから行い、元画像を2回読まない
+            source_hash = None
+            if cache is not None:
+                source_hash = (source_hashes or {}).get(task["input_path"]) or hashlib.sha256(data).hexdigest()
+                cached = lookup_cache(cache, task, source_hash)
+                if cached:
+                    await budget.release(size)
+                    emit(i, cached)
+                    continue
+            
+            await decode_queue.put((i, task, source_hash, data, size))
+        
+        for _ in range(jobs):
+            await decode_queue.put(None)
+    
+    async def transform() -> None:
+        while (item := await decode_queue.get()) is not None:
+            i, task, source_hash, data, size = item
+            try:
+                result = await loop.run_in_executor(cpu_pool, _transform_task, task, data)
+            except Exception as e:
+                result = {**_failed_result(task), "action": [f"エラー: {e}"]}
+            # 元画像のデータはここで手放し、書き込みが終わるまでは出力の分として予算を使い続ける
+            del data
+            await write_queue.put((i, task, source_hash, result, size))
+    
+    async def write() -> None:
+        while (item := await write_queue.get()) is not None:
+            i, task, source_hash, result, size = item
+            if result["success"]:
+                try:
+                    await loop.run_in_executor(io_pool, write_result, result, task.get("fingerprint", False))
+                except Exception as e:
+                    result.pop("files", None)
+                    result["success"] = False
+                    result["action"].append(f"エラー: {e}")
+            if source_hash is not None and result["success"]:
+                update_cache(cache, task, source_hash, result)
+            await budget.release(size)
+            emit(i, result)
+    
+    writers = max(2, jobs)
+    with ThreadPoolExecutor(max_workers=writers + 2) as io_pool, \
+            nullcontext(executor) if executor else ProcessPoolExecutor(max_workers=jobs) as cpu_pool:
+        reader = asyncio.create_task(read())
+        transformers = [asyncio.create_task(transform()) for _ in range(jobs)]
+        writer_tasks = [asyncio.create_task(write()) for _ in range(writers)]
+        
+        await reader
+        await asyncio.gather(*transformers)
+        for _ in writer_tasks:
+            await write_queue.put(None)
+        await asyncio.gather(*writer_tasks)
+
+
+def _failed_result(task: dict) -> dict:
+    """処理できなかったタスクの結果"""
+    return {"input": str(task["input_path"]), "output": str(task["output_path"]), "success": False}
+
+
+def iter_tasks_pipelined(
+    tasks: Iterable[dict],
+    jobs: int = 1,
+    cache: Optional[dict] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    max_mb: int = PIPELINE_MAX_MB,
+    source_hashes: Optional[dict[Path, str]] = None
+) -> Iterator[tuple[int, dict]]:
+    """
+    iter_tasks と同じ結果を、元画像の読み込み・変換・書き込みを重ねて実行して完了順に返すジェネレータ
+
+    元画像が遅いストレージ（ネットワーク共有など）にある場合、読み込みを待つ間も変換を進め、
+    変換中にも次の元画像を先読みする。変換はメモリ上で行い（process_image の source・write）、
+    出力の書き込みも別のスレッドで行う。
+    先読みした元画像と書き込み待ちの出力は、元画像のバイト数の合計で max_mb（MB）までに抑える。
+    パイプラインは asyncio で別のスレッドで動かす。
+
+    Args:
+        tasks: process_image のキーワード引数の辞書
+        jobs: 変換の並列数（プロセス数）
+        cache: load_cache で読み込んだキャッシュ（キャッシュの確認には読み込んだデータを使う）
+        executor: 使い回すプロセスプール（指定時は新しく作らず、終了もしない）
+        max_mb: 同時に扱う元画像のバイト数の上限（MB）
+        source_hashes: 計算済みの元画像のハッシュ（入力パス → SHA-256）
+    """
+    results = queue.Queue()
+    
+    def run() -> None:
+        try:
+            asyncio.run(_run_pipeline(
+                tasks,
+                max(jobs, 1),
+                cache,
+                executor,
+                max_mb * 1024 * 1024,
+                lambda i, result: results.put((i, result)),
+                source_hashes
+            ))
+        except BaseException as e:
+            results.put(e)
+        results.put(None)
+    
+    threading.Thread(target=run, daemon=True).start()
+    
+    while (item := results.get()) is not None:
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _srcset_variant(variant: dict, output_dir: Path) -> dict:
+    """srcsetマニフェストに書き込む1幅分の情報"""
+    entry = {
+        "src": _relative_to(variant["path"], output_dir),
+        "width": variant["width"],
+        "height": variant["height"],
+        "bytes": variant["bytes"],
+    }
+    
+    # 複数形式で出力した場合は <picture> の <source> 用に形式ごとの情報も含める
+    if "formats" in variant:
+        entry["formats"] = {
+            fmt: {"src": _relative_to(saved["path"], output_dir), "bytes": saved["bytes"]}
+            for fmt, saved in variant["formats"].items()
+        }
+    
+    return entry
+
+
+def update_srcset_manifest(results: list[dict], output_dir: Path) -> Optional[Path]:
+    """
+    srcset用に生成した画像の一覧をマニフェスト（JSON）に書き込む
+
+    キーは出力ディレクトリからの相対パス（論理的な出力名）、値は幅・高さ・バイト数の一覧。
+    既存のマニフェストがあれば今回の結果で該当エントリだけ更新する。
+
+    Returns:
+        書き込んだマニフェストのパス（srcset対象がなければ None）
+    """
+    entries = {
+        _relative_to(result["output"], output_dir): {
+            "variants": [
+                _srcset_variant(variant, output_dir)
+                for variant in result["variants"]
+            ]
+        }
+        for result in results
+        if result["success"] and "variants" in result
+    }
+    
+    return write_manifest(output_dir / SRCSET_MANIFEST_FILENAME, entries)
+
+
+def update_preview_manifest(results: list[dict], output_dir: Path) -> Optional[Path]:
+    """
+    プレビュー情報（LQIP・BlurHash・平均色）をマニフェスト（JSON）に書き込む
+
+    キーは出力ディレクトリからの相対パス。placeholder_generator.py --from-manifest で
+    インラインSVGのプレースホルダーに変換できる。
+
+    Returns:
+        書き込んだマニフェストのパス（プレビューがなければ None）
+    """
+    entries = {
+        _relative_to(result["output"], output_dir): result["preview"]
+        for result in results
+        if result["success"] and "preview" in result
+    }
+    
+    return write_manifest(output_dir / PREVIEW_MANIFEST_FILENAME, entries)
+
+
+def update_asset_manifest(results: list[dict], output_dir: Path) -> Optional[Path]:
+    """
+    論理名（フィンガープリントなしの出力名）と、内容ハッシュ入りのパスの対応をマニフェスト（JSON）に書き込む
+
+    キー・値とも出力ディレクトリからの相対パス。
+    以前の処理で同じ論理名に対応していたファイルが今回のものと異なれば削除する。
+
+    Returns:
+        書き込んだマニフェストのパス（フィンガープリント対象がなければ None）
+    """
+    entries = {}
+    for result in results:
+        if not result["success"] or "assets" not in result:
+            continue
+        for asset in result["assets"]:
+            path = Path(asset["path"])
+            entries[_relative_to(path.with_name(asset["name"]), output_dir)] = _relative_to(path, output_dir)
+    
+    manifest_path = output_dir / ASSET_MANIFEST_FILENAME
+    if entries and manifest_path.exists():
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+        
+        for name, path in entries.items():
+            old = previous.get(name)
+            if old and old != path:
+                (output_dir / old).unlink(missing_ok=True)
+    
+    return write_manifest(manifest_path, entries)
+
+
+def write_manifest(manifest_path: Path, entries: dict) -> Optional[Path]:
+    """
+    マニフェスト（JSON）の該当エントリだけを更新して書き込む
+
+    Returns:
+        書き込んだマニフェストのパス（entries が空なら書き込まずに None）
+    """
+    if not entries:
+        return None
+    
+    manifest = {}
+    
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+    
+    manifest.update(entries)
+    
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(manifest.items())), f, ensure_ascii=False, indent=2)
+    
+    return manifest_path
+
+
+def _run_batch(
+    tasks: Iterable[dict],
+    output_dir: Path,
+    jobs: int,
+    use_cache: bool,
+    dedupe: bool = False,
+    similar: Optional[int] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    report_stale: bool = True,
+    pipeline_mb: Optional[int] = None,
+    count: Optional[Callable[[], int]] = None
+) -> Iterator[dict]:
+    """
+    キャッシュ・srcset・プレビュー・アセットのマニフェストの更新を含めて iter_tasks を実行するジェネレータ
+
+    処理結果には tasks 内の番号 "index" と総数 "total" を付けて完了順に返し、
+    最後に古い出力の報告（"index" は None）を返す。
+    tasks がジェネレータの場合、読み終わるまで "total" は None になる。
+    count（タスク数が分かるまで待って返す関数）を指定すると別スレッドで待ち、読み終わる前でも分かった時点で "total" にする。
+    マニフェストとキャッシュは最後まで読み進めた時点で書き込まれる。
+
+    dedupe を指定すると、元画像の内容（SHA-256）と処理設定が前のタスクと同じタスクは処理せず、
+    すべての処理が終わった後で最初のタスクの出力をリンクする（link_duplicate）。
+    similar を指定すると、知覚ハッシュの距離がこれ以下の組を最後に報告する（find_similar）。
+    一部の画像だけを処理する場合（--watch）は report_stale を False にして古い出力の報告を省く。
+    pipeline_mb は iter_tasks に渡す。
     """
-    result = {
-        "input": str(input_path),
-        "output": str(output_path),
-        "success": False,
-        "action": [],
-    }
+    cache = load_cache(output_dir) if use_cache else None
+    srcset_results = []
+    preview_results = []
+    asset_results = []
+    hashed_results = []
+    seen_tasks = []
+    total = len(tasks) if isinstance(tasks, list) else None
     
-    suffix = input_path.suffix.lower()
+    if total is None and count is not None:
+        def count_tasks() -> None:
+            nonlocal total
+            counted = count()
+            if total is None:
+                total = counted
+        
+        threading.Thread(target=count_tasks, daemon=True).start()
     
-    # SVGなどはそのままコピー
-    if suffix in COPY_EXTENSIONS:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(input_path, output_path)
-        result["success"] = True
-        result["action"].append("コピー（変換なし）")
-        return result
+    # 重複検出用（iter_tasks に渡したタスクの番号 → tasks 内の番号など）
+    # 重複検出で計算した元画像のハッシュはキャッシュの確認にも使い、元画像を読み直さない
+    source_hashes = {}
+    positions = []
+    originals = {}
+    duplicates = []
+    original_results = {}
     
-    # 画像ファイルでなければスキップ
-    if suffix not in IMAGE_EXTENSIONS:
-        result["action"].append("スキップ（非対応形式）")
-        return result
+    def feed() -> Iterator[dict]:
+        nonlocal total
+        for task in tasks:
+            seen_tasks.append(task)
+            position = len(seen_tasks) - 1
+            if dedupe:
+                # 設定ファイルでは画像ごとに設定が違いうるので、処理設定も同じものだけをまとめる
+                source_hashes[task["input_path"]] = file_hash(task["input_path"])
+                key = (source_hashes[task["input_path"]], json.dumps(_cache_params(task), sort_keys=True))
+                if key in originals:
+                    duplicates.append((position, task, originals[key]))
+                    continue
+                originals[key] = position
+            positions.append(position)
+            yield task
+        total = len(seen_tasks)
     
-    if not PIL_AVAILABLE:
-        result["action"].append("エラー: Pillowがインストールされていません")
+    def collect(result: dict) -> dict:
+        result["total"] = total
+        if "variants" in result:
+            srcset_results.append(result)
+        if "preview" in result:
+            preview_results.append(result)
+        if "assets" in result:
+            asset_results.append(result)
+        if "perceptual_hash" in result:
+            hashed_results.append(result)
         return result
     
-    try:
-        with Image.open(input_path) as img:
-            original_size = img.size
-            
-            # RGBAモードの場合、WebP変換時に対応
-            if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
-                # アルファチャンネルを持つ画像はそのまま処理
-                pass
-            elif img.mode != "RGB":
-                img = img.convert("RGB")
-                result["action"].append("RGB変換")
-            
-            # リサイズ
-            resized_img = resize_image(img, max_width, max_height)
-            new_size = resized_img.size
-            
-            if original_size != new_size:
-                result["action"].append(f"リサイズ: {original_size[0]}x{original_size[1]} → {new_size[0]}x{new_size[1]}")
-            
-            # 出力パスを決定
-            if convert_to_webp and suffix != ".webp":
-                output_path = output_path.with_suffix(".webp")
-                result["output"] = str(output_path)
-                result["action"].append("WebP変換")
-            
-            # 出力ディレクトリ作成
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # 保存
-            output_suffix = output_path.suffix.lower()
-            
-            if output_suffix == ".webp":
-                # アルファチャンネルがある場合
-                if resized_img.mode in ("RGBA", "LA"):
-                    resized_img.save(output_path, "WEBP", quality=quality, lossless=False)
-                else:
-                    resized_img.save(output_path, "WEBP", quality=quality)
-            elif output_suffix in (".jpg", ".jpeg"):
-                # JPEGはアルファチャンネルをサポートしないのでRGBに変換
-                if resized_img.mode in ("RGBA", "LA"):
-                    resized_img = resized_img.convert("RGB")
-                resized_img.save(output_path, "JPEG", quality=quality)
-            elif output_suffix == ".png":
-                resized_img.save(output_path, "PNG", optimize=True)
-            else:
-                resized_img.save(output_path)
-            
-            result["success"] = True
-            
-            if not result["action"]:
-                result["action"].append("処理なし（変更不要）")
+    for index, result in iter_tasks(feed(), jobs, cache, executor, pipeline_mb, source_hashes):
+        result["index"] = positions[index]
+        if dedupe:
+            original_results[result["index"]] = result
+        yield collect(result)
     
-    except Exception as e:
-        result["action"].append(f"エラー: {e}")
+    for position, task, source in duplicates:
+        result = link_duplicate(original_results[source], task)
+        result["index"] = position
+        yield collect(result)
     
-    return result
+    if similar is not None:
+        for result in find_similar(hashed_results, similar):
+            result["index"] = None
+            yield result
+    
+    update_srcset_manifest(srcset_results, output_dir)
+    update_preview_manifest(preview_results, output_dir)
+    update_asset_manifest(asset_results, output_dir)
+    
+    if cache is not None:
+        if report_stale:
+            for result in collect_stale(cache, seen_tasks):
+                result["index"] = None
+                yield result
+        save_cache(cache)
+
+
+def is_ignored(directory: Path, input_dir: Path, ignore: Iterable[str]) -> bool:
+    """ディレクトリの名前または input_dir からの相対パスが ignore のパターン（fnmatch形式）に一致するか"""
+    relative = directory.relative_to(input_dir).as_posix()
+    return any(
+        fnmatch.fnmatch(directory.name, pattern) or fnmatch.fnmatch(relative, pattern)
+        for pattern in ignore
+    )
+
+
+def scan_images(
+    input_dir: Path,
+    recursive: bool = True,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    sort: bool = True
+) -> Iterator[Path]:
+    """
+    ディレクトリを os.scandir でたどり、処理対象の拡張子のファイルを見つけた順に返すジェネレータ
+
+    ignore のパターン（fnmatch形式）に名前または input_dir からの相対パスが一致する
+    ディレクトリは中に入らない。シンボリックリンクのディレクトリはたどらない。
+
+    Args:
+        input_dir: 入力ディレクトリ
+        recursive: サブディレクトリもたどるか
+        ignore: 除外するディレクトリのパターン
+        sort: 各ディレクトリ内を名前順にたどるか（全体がパス順になり、結果の順序が決まる）
+    """
+    all_extensions = IMAGE_EXTENSIONS | COPY_EXTENSIONS
+    ignore = tuple(ignore)
+    
+    def walk(directory: Path) -> Iterator[Path]:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name) if sort else list(it)
+        
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                # サブディレクトリは名前の位置でたどる（sorted(rglob) と同じパス順になる）
+                if recursive and not is_ignored(Path(entry.path), input_dir, ignore):
+                    yield from walk(Path(entry.path))
+            elif os.path.splitext(entry.name)[1].lower() in all_extensions and entry.is_file():
+                yield Path(entry.path)
+    
+    yield from walk(input_dir)
 
 
 def process_directory(
@@ -206,10 +2394,33 @@ def process_directory(
     convert_to_webp: bool = True,
     quality: int = 85,
     recursive: bool = True,
-    flatten: bool = False
-) -> list[dict]:
+    flatten: bool = False,
+    jobs: int = 1,
+    use_cache: bool = False,
+    reducing_gap: Optional[float] = None,
+    widths: Optional[list[int]] = None,
+    formats: Optional[list[str]] = None,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    sort: bool = True,
+    preview: bool = False,
+    memory_mb: Optional[int] = None,
+    fingerprint: bool = False,
+    dedupe: bool = False,
+    similar: Optional[int] = None,
+    similar_hash: str = "dhash",
+    profile: bool = False,
+    paths: Optional[Iterable[Path]] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    pipeline_mb: Optional[int] = None,
+    png_tolerance: Optional[float] = None
+) -> Iterator[dict]:
     """
-    ディレクトリ内の画像を一括処理
+    ディレクトリ内の画像を一括処理し、処理結果を完了順に返すジェネレータ
+
+    ディレクトリは scan_images でたどり、すべて見つけ終わる前から処理を始める。
+    各結果の "index" は見つけた順（sort 時はパス順）の番号。
     
     Args:
         input_dir: 入力ディレクトリ
@@ -220,57 +2431,145 @@ def process_directory(
         quality: 画像品質
         recursive: サブディレクトリも処理するか
         flatten: 出力をフラットにするか（サブディレクトリ構造を維持しない）
+        jobs: 並列数（1なら逐次処理）
+        use_cache: 出力ディレクトリのキャッシュを使い、変更のない画像をスキップするか
+        reducing_gap: 縮小デコード・整数縮小の倍率（None なら全画素から処理）
+        widths: srcset用に生成する幅のリスト（指定時は max_width の代わりに使用）
+        formats: 出力形式のリスト（指定時は convert_to_webp の代わりに使用）
+        target_kb: 目標ファイルサイズ（KB、quality を上限に品質を探索）
+        min_ssim: SSIMの下限（quality を上限に、これを満たす最も低い品質を探索）
+        ignore: たどらないディレクトリのパターン（fnmatch形式）
+        sort: パス順にたどるか（False なら scandir の返す順で、少し速い）
+        preview: LQIP・BlurHash・平均色を作り、PREVIEW_MANIFEST_FILENAME に書き込むか
+        memory_mb: 1枚の処理に使うメモリの上限（MB、超える画像は縮小デコードするかエラー）
+        fingerprint: 出力を内容ハッシュ入りの名前にし、ASSET_MANIFEST_FILENAME に論理名との対応を書き込むか
+        dedupe: 内容が同じ元画像は1回だけ処理し、残りは出力をハードリンクするか
+        similar: 知覚ハッシュの距離がこれ以下の画像の組を類似画像として報告する（None なら検出しない）
+        similar_hash: 類似画像の検出に使う知覚ハッシュ（PERCEPTUAL_HASH_FUNCTIONS のキー）
+        profile: 段階ごとの処理時間とピークメモリを各結果の "profile" に記録するか
+        paths: 処理する画像（input_dir 内のパス）。指定時はディレクトリをたどらず、古い出力も報告しない
+        executor: 使い回すプロセスプール（--watch で起動済みのワーカーを使う）
+        pipeline_mb: 指定すると読み込み・変換・書き込みを重ねて実行し、先読みをこのMBまでに抑える（iter_tasks_pipelined）
+        png_tolerance: 指定するとPNGの出力を最適化し、減色はこの誤差まで許す（optimize_png）
     """
-    results = []
+    # ディレクトリは別スレッドで1回だけたどり、見つけた画像を順に渡す
+    # （処理を待たずにたどり終えるため、その時点で進捗表示の総数が分かる）
+    found = queue.Queue()
+    scanned = threading.Event()
+    scanned_count = 0
     
-    # 画像ファイルを収集
-    all_extensions = IMAGE_EXTENSIONS | COPY_EXTENSIONS
+    def scan() -> None:
+        nonlocal scanned_count
+        try:
+            for input_path in scan_images(input_dir, recursive, ignore, sort):
+                found.put(input_path)
+                scanned_count += 1
+        except Exception as e:
+            found.put(e)
+        finally:
+            found.put(None)
+            scanned.set()
     
-    if recursive:
-        files = [f for f in input_dir.rglob("*") if f.suffix.lower() in all_extensions]
-    else:
-        files = [f for f in input_dir.glob("*") if f.suffix.lower() in all_extensions]
+    def found_paths() -> Iterator[Path]:
+        threading.Thread(target=scan, daemon=True).start()
+        while (item := found.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
     
-    for input_path in sorted(files):
-        # 出力パスを決定
-        if flatten:
-            output_path = output_dir / input_path.name
-        else:
-            relative_path = input_path.relative_to(input_dir)
-            output_path = output_dir / relative_path
-        
-        result = process_image(
-            input_path,
-            output_path,
-            max_width,
-            max_height,
-            convert_to_webp,
-            quality
-        )
-        results.append(result)
+    def count() -> int:
+        scanned.wait()
+        return scanned_count
     
-    return results
+    def tasks() -> Iterator[dict]:
+        # 見つけた画像から順にタスクを作り、すべて見つけ終わる前から処理を始める
+        for input_path in found_paths() if paths is None else paths:
+            # 出力パスを決定
+            if flatten:
+                output_path = output_dir / input_path.name
+            else:
+                relative_path = input_path.relative_to(input_dir)
+                output_path = output_dir / relative_path
+            
+            yield {
+                "input_path": input_path,
+                "output_path": output_path,
+                "max_width": max_width,
+                "max_height": max_height,
+                "convert_to_webp": convert_to_webp,
+                "quality": quality,
+                "reducing_gap": reducing_gap,
+                "widths": widths,
+                "formats": formats,
+                "target_kb": target_kb,
+                "min_ssim": min_ssim,
+                "preview": preview,
+                "memory_mb": memory_mb,
+                "fingerprint": fingerprint,
+                "perceptual_hash": similar_hash if similar is not None else None,
+                "png_tolerance": png_tolerance,
+                "profile": profile,
+            }
+    
+    if paths is not None:
+        paths = list(paths)
+    
+    yield from _run_batch(
+        tasks(), output_dir, jobs, use_cache, dedupe, similar, executor, paths is None, pipeline_mb,
+        count if paths is None else lambda: len(paths)
+    )
 
 
 def process_config_file(
     config_path: Path,
     input_dir: Path,
-    output_dir: Path
-) -> list[dict]:
+    output_dir: Path,
+    jobs: int = 1,
+    use_cache: bool = False,
+    reducing_gap: Optional[float] = None,
+    widths: Optional[list[int]] = None,
+    formats: Optional[list[str]] = None,
+    target_kb: Optional[int] = None,
+    min_ssim: Optional[float] = None,
+    preview: bool = False,
+    memory_mb: Optional[int] = None,
+    fingerprint: bool = False,
+    dedupe: bool = False,
+    similar: Optional[int] = None,
+    similar_hash: str = "dhash",
+    profile: bool = False,
+    paths: Optional[Iterable[Path]] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    pipeline_mb: Optional[int] = None,
+    png_tolerance: Optional[float] = None
+) -> Iterator[dict]:
     """
-    JSON設定ファイルから画像を処理（リネーム対応）
+    JSON設定ファイルから画像を処理（リネーム対応）し、処理結果を完了順に返すジェネレータ
+
+    各結果の "index" は設定ファイルの images の中での番号。
+    入力ファイルがないなどのエラーは、逐次処理では入力順の位置で返す。
+    jobs・use_cache・reducing_gap・preview・memory_mb・fingerprint・dedupe・similar・profile・pipeline_mb の扱いは
+    process_directory と同じ（dedupe は元画像と設定の両方が同じ項目だけをまとめる）。
+    fingerprint 指定時のマニフェストのキー（論理名）は設定ファイルの output になる。
+    paths を指定すると、input がそのいずれかに一致する項目だけを処理する（executor とともに --watch 用）。
+    widths・formats・target_kb・min_ssim・png_tolerance は設定ファイルに指定がない場合のデフォルトとして使う
+    （設定ファイルの png_tolerance は null でPNGの最適化をしない）。
 
     JSON形式:
     {
       "images": [
         {"input": "photo001.jpg", "output": "hero.webp", "max_width": 1200},
-        {"input": "photo002.png", "output": "about-bg.webp"}
+        {"input": "photo002.png", "output": "about-bg.webp"},
+        {"input": "photo003.jpg", "output": "gallery.webp", "widths": [480, 768, 1200]},
+        {"input": "photo004.jpg", "output": "lp-hero.webp", "target_kb": 150}
       ],
       "default": {
         "max_width": 1200,
         "max_height": null,
         "quality": 85,
-        "convert_to_webp": true
+        "convert_to_webp": true,
+        "widths": null,
+        "formats": ["avif", "webp"]
       }
     }
     """
@@ -283,34 +2582,48 @@ def process_config_file(
     default_max_height = defaults.get("max_height", None)
     default_quality = defaults.get("quality", 85)
     default_convert = defaults.get("convert_to_webp", True)
+    default_widths = defaults.get("widths", widths)
+    default_formats = defaults.get("formats", formats)
+    default_target_kb = defaults.get("target_kb", target_kb)
+    default_min_ssim = defaults.get("min_ssim", min_ssim)
+    default_png_tolerance = defaults.get("png_tolerance", png_tolerance)
 
     # 画像リスト取得
     images = config.get("images", [])
+    if paths is not None:
+        paths = set(paths)
 
-    results = []
+    # 設定エラーは images 内の位置とともに保持し、処理結果の間に入力順で差し込む
+    errors: list[tuple[int, dict]] = []
+    tasks = []
+    positions = []
+    renames = []
 
-    for item in images:
+    for position, item in enumerate(images):
         input_name = item.get("input")
         output_name = item.get("output", input_name)
 
         if not input_name:
-            results.append({
+            errors.append((position, {
                 "input": "不明",
                 "output": "不明",
                 "success": False,
                 "action": ["エラー: inputが指定されていません"]
-            })
+            }))
             continue
 
         input_path = input_dir / input_name
 
+        if paths is not None and input_path not in paths:
+            continue
+
         if not input_path.exists():
-            results.append({
+            errors.append((position, {
                 "input": str(input_path),
                 "output": str(output_dir / output_name),
                 "success": False,
                 "action": [f"エラー: ファイルが見つかりません"]
-            })
+            }))
             continue
 
         output_path = output_dir / output_name
@@ -320,50 +2633,498 @@ def process_config_file(
         max_height = item.get("max_height", default_max_height)
         quality = item.get("quality", default_quality)
         convert_to_webp = item.get("convert_to_webp", default_convert)
+        item_widths = item.get("widths", default_widths)
+        item_formats = item.get("formats", default_formats)
+        item_target_kb = item.get("target_kb", default_target_kb)
+        item_min_ssim = item.get("min_ssim", default_min_ssim)
+        item_png_tolerance = item.get("png_tolerance", default_png_tolerance)
 
-        result = process_image(
-            input_path,
-            output_path,
-            max_width,
-            max_height,
-            convert_to_webp,
-            quality
-        )
+        tasks.append({
+            "input_path": input_path,
+            "output_path": output_path,
+            "max_width": max_width,
+            "max_height": max_height,
+            "convert_to_webp": convert_to_webp,
+            "quality": quality,
+            "reducing_gap": reducing_gap,
+            "widths": item_widths,
+            "formats": [normalize_format(fmt) for fmt in item_formats] if item_formats else None,
+            "target_kb": item_target_kb,
+            "min_ssim": item_min_ssim,
+            "preview": preview,
+            "memory_mb": memory_mb,
+            "fingerprint": fingerprint,
+            "perceptual_hash": similar_hash if similar is not None else None,
+            "png_tolerance": item_png_tolerance,
+            "profile": profile,
+        })
+        positions.append(position)
+        renames.append((input_name, output_name))
+
+    errors.reverse()
+
+    def flush_errors(before: int) -> Iterator[dict]:
+        while errors and errors[-1][0] < before:
+            position, error = errors.pop()
+            error["index"] = position
+            error["total"] = len(images)
+            yield error
+
+    for result in _run_batch(tasks, output_dir, jobs, use_cache, dedupe, similar, executor, paths is None, pipeline_mb):
+        # 古い出力の報告
+        if result["index"] is None:
+            yield from flush_errors(len(images))
+            yield result
+            continue
+
+        input_name, output_name = renames[result["index"]]
+        result["index"] = positions[result["index"]]
+        result["total"] = len(images)
 
         # リネームされた場合はアクションに追加
         if input_name != output_name:
             result["action"].insert(0, f"リネーム: {input_name} → {output_name}")
 
-        results.append(result)
+        yield from flush_errors(result["index"])
+        yield result
+
+    yield from flush_errors(len(images))
+
+
+def _is_target(path: Path) -> bool:
+    return path.suffix.lower() in IMAGE_EXTENSIONS | COPY_EXTENSIONS
+
+
+def _snapshot(input_dir: Path, recursive: bool, ignore: Iterable[str]) -> dict[Path, tuple[int, int]]:
+    """処理対象の画像ごとの (更新時刻, サイズ)"""
+    snapshot = {}
+    for path in scan_images(input_dir, recursive, ignore, sort=False):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def poll_changes(
+    input_dir: Path,
+    recursive: bool = True,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    interval: float = WATCH_POLL_INTERVAL
+) -> Iterator[set[Path]]:
+    """
+    ディレクトリを interval 秒ごとにたどり、追加・更新された画像の集合を返し続けるジェネレータ
+
+    変更がなければ空の集合を返す。inotify が使えない環境（macOS・Windows・一部のネットワークドライブ）用。
+    """
+    ignore = tuple(ignore)
+    previous = _snapshot(input_dir, recursive, ignore)
+    
+    while True:
+        time.sleep(interval)
+        current = _snapshot(input_dir, recursive, ignore)
+        yield {path for path, stat in current.items() if previous.get(path) != stat}
+        previous = current
+
+
+def inotify_changes(
+    input_dir: Path,
+    recursive: bool = True,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS
+) -> Iterator[set[Path]]:
+    """
+    inotify で追加・更新された画像の集合を返し続けるジェネレータ（Linux、要 inotify_simple）
+
+    書き込みが終わった（CLOSE_WRITE）・移動してきた（MOVED_TO）ファイルを WATCH_INOTIFY_TIMEOUT 秒ごとにまとめて返し、
+    イベントがなければ空の集合を返す。新しくできたサブディレクトリも監視に加える。
+    """
+    ignore = tuple(ignore)
+    inotify = INotify()
+    mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+    directories = {}
+    
+    def watch_tree(directory: Path) -> set[Path]:
+        # 監視を始める前に置かれたファイルは、中身を見て変更として扱う
+        directories[inotify.add_watch(directory, mask)] = directory
+        found = set()
+        with os.scandir(directory) as it:
+            for entry in it:
+                path = Path(entry.path)
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not is_ignored(path, input_dir, ignore):
+                        found |= watch_tree(path)
+                elif _is_target(path) and entry.is_file():
+                    found.add(path)
+        return found
+    
+    watch_tree(input_dir)
+    
+    with inotify:
+        while True:
+            changed = set()
+            for event in inotify.read(timeout=int(WATCH_INOTIFY_TIMEOUT * 1000)):
+                if event.mask & inotify_flags.IGNORED:
+                    # 削除されたディレクトリ
+                    directories.pop(event.wd, None)
+                    continue
+                
+                directory = directories.get(event.wd)
+                if directory is None or not event.name:
+                    continue
+                
+                path = directory / event.name
+                if event.mask & inotify_flags.ISDIR:
+                    if recursive and path.is_dir() and not is_ignored(path, input_dir, ignore):
+                        changed |= watch_tree(path)
+                elif event.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO) and _is_target(path):
+                    changed.add(path)
+            yield changed
+
+
+def watch_changes(
+    input_dir: Path,
+    output_dir: Path,
+    recursive: bool = True,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    debounce: float = WATCH_DEBOUNCE,
+    poll: bool = False
+) -> Iterator[set[Path]]:
+    """
+    入力ディレクトリを監視し、変更された画像の集合を返すジェネレータ
+
+    inotify が使えれば inotify_changes、なければ（または poll 指定時は）poll_changes で監視する。
+    コピー中など変更が続いている間は待ち、最後の変更から debounce 秒たった時点でまとめて返す。
+    出力ディレクトリが入力ディレクトリの中にある場合、出力の変更は無視する。
+    """
+    if poll or not INOTIFY_AVAILABLE:
+        changes = poll_changes(input_dir, recursive, ignore)
+    else:
+        changes = inotify_changes(input_dir, recursive, ignore)
+    
+    output_dir = output_dir.resolve()
+    pending = set()
+    last_change = 0.0
+    
+    for changed in changes:
+        changed = {path for path in changed if output_dir not in path.resolve().parents}
+        now = time.monotonic()
+        if changed:
+            pending |= changed
+            last_change = now
+        elif pending and now - last_change >= debounce:
+            # まとめて待つ間に削除されたファイルは除く
+            yield {path for path in pending if path.is_file()}
+            pending = set()
+
+
+def _init_watch_worker() -> None:
+    """Ctrl+C はメインプロセスだけで受け取り、ワーカーは executor の終了で止める"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-    return results
 
+def _warm_worker() -> None:
+    """ワーカーでPillowとWebPエンコーダーを読み込んでおく"""
+    encode_image(Image.new("RGB", (8, 8)), io.BytesIO(), ".webp", 80)
 
-def print_results(results: list[dict]) -> None:
-    """処理結果を表示"""
-    success_count = 0
-    skip_count = 0
-    error_count = 0
+
+def warm_up(executor: ProcessPoolExecutor, jobs: int) -> None:
+    """プロセスプールのワーカーを起動し、最初の変更から並列で処理できるようにする"""
+    for future in [executor.submit(_warm_worker) for _ in range(jobs)]:
+        future.result()
+
+
+def normalize_format(fmt: str) -> str:
+    """出力形式名を FORMAT_EXTENSIONS のキーに正規化（jpg → jpeg）"""
+    fmt = fmt.strip().lower().lstrip(".")
+    fmt = "jpeg" if fmt == "jpg" else fmt
+    
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"非対応の出力形式: {fmt}（対応: {', '.join(FORMAT_EXTENSIONS)}）")
+    if PIL_AVAILABLE and fmt in ("avif", "webp") and not features.check(fmt):
+        raise ValueError(f"このPillowは{fmt.upper()}の書き出しに対応していません")
+    
+    return fmt
+
+
+def parse_formats(formats_str: str) -> list[str]:
+    """出力形式リスト文字列をパース（例: "avif,webp,jpg" → ["avif", "webp", "jpeg"]）"""
+    formats = []
+    
+    for value in formats_str.split(","):
+        if value.strip():
+            fmt = normalize_format(value)
+            if fmt not in formats:
+                formats.append(fmt)
+    
+    if not formats:
+        raise ValueError(f"無効な出力形式の指定: {formats_str}（例: avif,webp,jpeg）")
+    
+    return formats
+
+
+def parse_widths(widths_str: str) -> list[int]:
+    """幅リスト文字列をパース（例: "480,768,1200" → [480, 768, 1200]）"""
+    try:
+        widths = [int(value) for value in widths_str.split(",") if value.strip()]
+    except ValueError:
+        raise ValueError(f"無効な幅指定: {widths_str}（例: 480,768,1200）")
+    
+    if not widths or any(width <= 0 for width in widths):
+        raise ValueError(f"無効な幅指定: {widths_str}（例: 480,768,1200）")
+    
+    return widths
+
+
+def result_status(result: dict) -> str:
+    """処理結果の分類（success / cached / skip / stale / similar / error）"""
+    if result.get("cached"):
+        return "cached"
+    if result.get("stale"):
+        return "stale"
+    if result.get("similar"):
+        return "similar"
+    if result["success"]:
+        return "success"
+    if any("スキップ" in action for action in result["action"]):
+        return "skip"
+    return "error"
+
+
+def png_savings(result: dict) -> list[int]:
+    """処理結果のPNGの出力ごとの最適化による削減バイト数（variants・formats を含む）"""
+    outputs = result.get("variants", [result])
+    return [
+        saved["png"]["bytes_saved"]
+        for output in outputs
+        for saved in (output["formats"].values() if "formats" in output else [output])
+        if "png" in saved
+    ]
+
+
+def format_duration(seconds: float) -> str:
+    """秒数を 分:秒 形式に変換"""
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """最近傍順位法でパーセンタイルを計算"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize_profile(profiles: list[dict]) -> dict:
+    """
+    各画像の result["profile"] を集計
+
+    Returns:
+        段階（と "total"）ごとの {"count", "sum", "p50", "p90", "p99", "max"}（秒）と
+        全画像の中での最大ピークRSS "peak_rss_mb"
+    """
+    samples: dict[str, list[float]] = {}
+    for profile in profiles:
+        for stage, seconds in profile["stages"].items():
+            samples.setdefault(stage, []).append(seconds)
+        samples.setdefault("total", []).append(profile["total"])
+    
+    order = [stage for stage in PROFILE_STAGES if stage in samples] + ["total"]
+    stages = {
+        stage: {
+            "count": len(samples[stage]),
+            "sum": round(sum(samples[stage]), 6),
+            "p50": percentile(samples[stage], 50),
+            "p90": percentile(samples[stage], 90),
+            "p99": percentile(samples[stage], 99),
+            "max": max(samples[stage]),
+        }
+        for stage in order
+    }
+    
+    peaks = [profile["peak_rss_mb"] for profile in profiles if profile["peak_rss_mb"] is not None]
+    
+    return {
+        "images": len(profiles),
+        "stages": stages,
+        "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+    }
+
+
+def print_profile(summary: dict) -> None:
+    """summarize_profile の結果を表形式で表示（ミリ秒）"""
+    print(f"\nプロファイル（{summary['images']}件、ミリ秒）:")
+    # 全角の見出しは表示幅が2倍になるため、その分だけ幅を詰める
+    print(f"  {'段階':<6} {'件数':>4} {'合計':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'最大':>6}")
+    for stage, stats in summary["stages"].items():
+        print(
+            f"  {stage:<8} {stats['count']:>6} {stats['sum'] * 1000:>10.1f}"
+            f" {stats['p50'] * 1000:>8.1f} {stats['p90'] * 1000:>8.1f}"
+            f" {stats['p99'] * 1000:>8.1f} {stats['max'] * 1000:>8.1f}"
+        )
+    if summary["peak_rss_mb"] is not None:
+        print(f"  ピークRSS: {summary['peak_rss_mb']:.1f} MB（1枚あたりの最大）")
+
+
+def print_results(results: Iterable[dict], json_lines: bool = False) -> None:
+    """
+    処理結果を受け取った順に表示し、最後に集計を表示
+
+    標準エラー出力が端末の場合は、進捗と残り時間の目安を1行で更新し続ける。
+    結果に "profile" があれば、最後に段階ごとの処理時間のパーセンタイルも表示する。
+
+    Args:
+        results: 処理結果（process_directory などのジェネレータをそのまま渡せる）
+        json_lines: 1件1行のJSONで出力し、最後に集計を {"summary": ...} として出力する
+    """
+    counts = {"success": 0, "cached": 0, "skip": 0, "stale": 0, "similar": 0, "error": 0}
+    show_progress = sys.stderr.isatty()
+    start = time.monotonic()
+    done = 0
+    duplicates = 0
+    profiles = []
+    png_saved = []
     
     for result in results:
+        if show_progress:
+            sys.stderr.write("\r\033[K")
+        
+        status = result_status(result)
+        counts[status] += 1
+        
         input_name = Path(result["input"]).name
         output_name = Path(result["output"]).name
         actions = ", ".join(result["action"])
         
-        if result["success"]:
-            success_count += 1
+        if json_lines:
+            print(json.dumps({**result, "status": status}, ensure_ascii=False), flush=True)
+        elif status == "cached":
+            if input_name != output_name:
+                print(f"= {input_name} → {output_name} ({actions})", flush=True)
+            else:
+                print(f"= {input_name} ({actions})", flush=True)
+        elif status == "stale":
+            print(f"! {output_name} ({actions})", flush=True)
+        elif status == "similar":
+            print(f"≈ {input_name} ({actions})", flush=True)
+        elif status == "success":
             if input_name != output_name:
-                print(f"✓ {input_name} → {output_name} ({actions})")
+                print(f"✓ {input_name} → {output_name} ({actions})", flush=True)
             else:
-                print(f"✓ {input_name} ({actions})")
-        elif "スキップ" in actions:
-            skip_count += 1
-            print(f"- {input_name} ({actions})")
+                print(f"✓ {input_name} ({actions})", flush=True)
+        elif status == "skip":
+            print(f"- {input_name} ({actions})", flush=True)
         else:
-            error_count += 1
-            print(f"✗ {input_name} ({actions})")
+            print(f"✗ {input_name} ({actions})", flush=True)
+        
+        if result.get("index") is not None:
+            done += 1
+        if result.get("duplicate_of") and result["success"]:
+            duplicates += 1
+        if "profile" in result:
+            profiles.append(result["profile"])
+        if status == "success":
+            png_saved.extend(png_savings(result))
+        
+        if show_progress:
+            elapsed = time.monotonic() - start
+            total = result.get("total")
+            if total:
+                remaining = elapsed / done * (total - done) if done else 0
+                sys.stderr.write(f"[{done}/{total}] {done * 100 // total}% 経過 {format_duration(elapsed)} 残り約 {format_duration(remaining)}")
+            else:
+                sys.stderr.write(f"[{done}] 経過 {format_duration(elapsed)}")
+            sys.stderr.flush()
+    
+    if show_progress:
+        sys.stderr.write("\r\033[K")
+        sys.stderr.flush()
+    
+    elapsed = time.monotonic() - start
+    profile_summary = summarize_profile(profiles) if profiles else None
+    
+    # キャッシュから返した画像を除いた、実際に処理した画像の処理速度
+    rate = counts["success"] / elapsed if elapsed > 0 else 0.0
+    
+    if json_lines:
+        summary = {**counts, "duplicate": duplicates, "seconds": round(elapsed, 3), "images_per_second": round(rate, 2)}
+        if png_saved:
+            summary["png_bytes_saved"] = sum(png_saved)
+        if profile_summary:
+            summary["profile"] = profile_summary
+        print(json.dumps({"summary": summary}), flush=True)
+        return
+    
+    throughput = f"、{rate:.1f}枚/秒" if counts["success"] else ""
+    print(f"\n完了: 成功 {counts['success']}件, キャッシュ {counts['cached']}件, スキップ {counts['skip']}件, エラー {counts['error']}件（{format_duration(elapsed)}{throughput}）")
+    if counts["stale"]:
+        print(f"古い出力: {counts['stale']}件（元画像が処理対象外のため削除を検討してください）")
+    if png_saved:
+        print(f"PNG最適化: {len(png_saved)}件（合計 {sum(png_saved) / 1024:.0f}KB削減）")
+    if duplicates:
+        print(f"重複: {duplicates}件（同じ内容の画像の出力をリンク）")
+    if counts["similar"]:
+        print(f"類似画像: {counts['similar']}組（同じ写真の別書き出しでないか確認してください）")
+    if profile_summary:
+        print_profile(profile_summary)
+
+
+def run_results(
+    results: Iterable[dict],
+    json_lines: bool = False,
+    profiler: Optional[cProfile.Profile] = None,
+    profile_out: Optional[Path] = None
+) -> None:
+    """処理結果を表示（profiler があれば処理全体を計測して profile_out に保存）"""
+    if profiler is None:
+        print_results(results, json_lines=json_lines)
+        return
+    
+    profiler.enable()
+    try:
+        print_results(results, json_lines=json_lines)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_out)
+    
+    print(f"cProfileの結果を保存しました: {profile_out}", file=sys.stderr if json_lines else sys.stdout)
+    if not json_lines:
+        print(f"  python -m pstats {profile_out}")
+
+
+def watch(
+    run,
+    input_dir: Path,
+    output_dir: Path,
+    recursive: bool = True,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    debounce: float = WATCH_DEBOUNCE,
+    poll: bool = False,
+    json_lines: bool = False
+) -> None:
+    """
+    入力ディレクトリを監視し、変更された画像だけを処理し続ける（Ctrl+C で終了）
+
+    起動時に一度全体を処理し（キャッシュで変更のない画像はスキップ）、以降は watch_changes が返す
+    画像だけを処理して結果を表示する。
+
+    Args:
+        run: 処理する画像のリスト（None なら全体）を受け取り、処理結果を返す関数
+            （process_directory・process_config_file に paths を渡すもの）
+    """
+    print_results(run(None), json_lines=json_lines)
+    
+    mode = "ポーリング" if poll or not INOTIFY_AVAILABLE else "inotify"
+    print(f"\n監視中（{mode}）: {input_dir}（Ctrl+C で終了）", file=sys.stderr if json_lines else sys.stdout, flush=True)
     
-    print(f"\n完了: 成功 {success_count}件, スキップ {skip_count}件, エラー {error_count}件")
+    for paths in watch_changes(input_dir, output_dir, recursive, ignore, debounce, poll):
+        if not paths:
+            continue
+        # 設定ファイルにない画像だけの変更では何も表示しない
+        results = run(sorted(paths))
+        first = next(results, None)
+        if first is not None:
+            print_results(itertools.chain([first], results), json_lines=json_lines)
 
 
 def main():
@@ -387,14 +3148,67 @@ def main():
   # サブディレクトリ構造をフラットにして出力
   python image_processor.py -i ./raw -o ./images --flatten
 
+  # 特定のディレクトリをたどらない（.git と node_modules は常に除外）
+  python image_processor.py -i ./raw -o ./images --ignore "_old*" --ignore "exports/tmp"
+
   # JSON設定ファイルでリネーム処理
   python image_processor.py --config images.json -i ./raw -o ./images
 
+  # 並列数を指定（1なら逐次処理）
+  python image_processor.py -i ./raw -o ./images --jobs 4
+
+  # キャッシュを使わず全画像を再処理
+  python image_processor.py -i ./raw -o ./images --no-cache
+
+  # 処理結果を1件1行のJSONで出力（CIログ用）
+  python image_processor.py -i ./raw -o ./images --json-lines
+
+  # JPEGを縮小デコードして高速化（値を省略すると 2.0）
+  python image_processor.py -i ./raw -o ./images --reducing-gap
+
+  # srcset用に複数の幅を生成（hero-480.webp, hero-768.webp ... と srcset.json）
+  python image_processor.py -i ./raw -o ./images --widths 480,768,1200,2000
+
+  # AVIFを主形式に、WebP・JPEGを代替として同時に出力
+  python image_processor.py -i ./raw -o ./images --formats avif,webp,jpeg
+
+  # 1枚あたり150KB以内に収まる品質を自動で選ぶ（--quality が上限）
+  python image_processor.py -i ./raw -o ./images --target-kb 150
+
+  # SSIM 0.95 以上を保てる最も低い品質を自動で選ぶ（要NumPy）
+  python image_processor.py -i ./raw -o ./images --min-ssim 0.95
+
+  # 読み込み中に表示するプレビュー（LQIP・BlurHash・平均色）を placeholders.json に出力
+  python image_processor.py -i ./raw -o ./images --preview
+
+  # 1枚あたりのメモリを512MBに抑える（超える画像は縮小デコード、できなければエラー）
+  python image_processor.py -i ./raw -o ./images --memory-mb 512
+
+  # 出力を内容ハッシュ入りの名前（hero.3fa9c2d1.webp）にし、assets.json に対応を出力
+  python image_processor.py --config images.json -i ./raw -o ./images --fingerprint
+
+  # 同じ内容の画像は1回だけ処理してリンクし、見た目の近い画像（dHashの距離5以下）を報告
+  python image_processor.py -i ./raw -o ./images --dedupe --similar 5
+
+  # 入力ディレクトリを監視し、追加・更新された画像だけを処理し続ける
+  python image_processor.py -c images.json -i ./raw -o ../front/public/images --watch
+
+  # PNGのまま、アイコンなどはパレット化して圧縮方法も比較し、最も小さく保存
+  python image_processor.py -i ./raw -o ./images --keep-format --png-optimize
+
+  # ネットワーク共有上の元画像を、読み込み・変換・書き込みを重ねて処理（先読みは合計512MBまで）
+  python image_processor.py -i //nas/photos -o ./images --pipeline --pipeline-mb 512
+
+  # 段階ごとの処理時間とピークメモリを計測し、cProfileの結果も保存
+  python image_processor.py -i ./raw -o ./images --no-cache --profile --profile-out profile.pstats
+
 JSON設定ファイル形式:
   {
     "images": [
       {"input": "photo001.jpg", "output": "hero.webp"},
-      {"input": "photo002.png", "output": "about-bg.webp", "max_width": 800}
+      {"input": "photo002.png", "output": "about-bg.webp", "max_width": 800},
+      {"input": "photo003.jpg", "output": "gallery.webp", "widths": [480, 768, 1200]},
+      {"input": "photo004.jpg", "output": "lp-hero.webp", "target_kb": 150}
     ],
     "default": {"max_width": 1200, "quality": 85}
   }
@@ -410,6 +3224,31 @@ JSON設定ファイル形式:
     parser.add_argument("--keep-format", "-k", action="store_true", help="WebPに変換せず元の形式を維持")
     parser.add_argument("--no-recursive", "-nr", action="store_true", help="サブディレクトリを処理しない")
     parser.add_argument("--flatten", "-f", action="store_true", help="出力をフラットにする")
+    parser.add_argument("--ignore", action="append", default=[], metavar="PATTERN", help="たどらないディレクトリ（fnmatch形式、複数指定可。.git と node_modules は常に除外）")
+    parser.add_argument("--no-sort", action="store_true", help="パス順に並べず見つけた順に処理（大量のファイルがある場合に少し速い）")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="並列数（デフォルト: CPUコア数、1なら逐次処理）")
+    parser.add_argument("--reducing-gap", type=float, nargs="?", const=DEFAULT_REDUCING_GAP, default=None, help=f"縮小デコードで残す目標サイズの倍率（指定時のみ縮小デコード、値を省略すると {DEFAULT_REDUCING_GAP}）")
+    parser.add_argument("--widths", type=str, help="srcset用に生成する幅（カンマ区切り、例: 480,768,1200,2000）")
+    parser.add_argument("--formats", type=str, help="出力形式（カンマ区切り、先頭が主形式。例: avif,webp,jpeg）")
+    parser.add_argument("--target-kb", type=int, default=None, help="目標ファイルサイズ（KB、--quality を上限に品質を自動調整）")
+    parser.add_argument("--min-ssim", type=float, default=None, help="SSIMの下限（0-1、--quality を上限にこれを満たす最も低い品質を選ぶ。要NumPy）")
+    parser.add_argument("--png-optimize", action="store_true", help="PNGの出力を色数に応じてパレット化し、圧縮方法を比較して最も小さくする")
+    parser.add_argument("--png-tolerance", type=float, default=DEFAULT_PNG_TOLERANCE, help=f"--png-optimize で減色を許す誤差（チャンネルごとの平均絶対誤差 0-255、デフォルト: {DEFAULT_PNG_TOLERANCE}、0 なら可逆のみ）")
+    parser.add_argument("--preview", action="store_true", help=f"LQIP・BlurHash・平均色を {PREVIEW_MANIFEST_FILENAME} に出力")
+    parser.add_argument("--memory-mb", type=int, default=None, help="1枚の処理に使うメモリの上限（MB、超える画像は縮小デコードするかエラー）")
+    parser.add_argument("--fingerprint", action="store_true", help=f"出力を内容ハッシュ入りの名前（name.<hash8>.webp）にし、{ASSET_MANIFEST_FILENAME} に対応を出力")
+    parser.add_argument("--dedupe", action="store_true", help="内容が同じ元画像は1回だけ処理し、残りは出力をハードリンク")
+    parser.add_argument("--similar", type=int, default=None, metavar="DISTANCE", help="知覚ハッシュの距離（0-64）がこれ以下の画像の組を類似画像として報告")
+    parser.add_argument("--similar-hash", choices=tuple(PERCEPTUAL_HASH_FUNCTIONS), default="dhash", help="類似画像の検出に使う知覚ハッシュ（デフォルト: dhash、phash は要NumPy）")
+    parser.add_argument("--pipeline", action="store_true", help="元画像の読み込み・変換・書き込みを重ねて実行（元画像が遅いストレージにある場合に速い）")
+    parser.add_argument("--pipeline-mb", type=int, default=PIPELINE_MAX_MB, help=f"--pipeline で先読み・書き込み待ちにする元画像の合計の上限（MB、デフォルト: {PIPELINE_MAX_MB}）")
+    parser.add_argument("--watch", action="store_true", help="入力ディレクトリを監視し、変更された画像だけを処理し続ける（Ctrl+C で終了）")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, help=f"--watch で最後の変更から処理を始めるまでの秒数（デフォルト: {WATCH_DEBOUNCE}）")
+    parser.add_argument("--poll", action="store_true", help="--watch で inotify を使わずポーリングで監視する")
+    parser.add_argument("--json-lines", action="store_true", help="処理結果を1件1行のJSONで出力（CIログ用）")
+    parser.add_argument("--profile", action="store_true", help="段階ごとの処理時間とピークメモリを計測して集計を表示")
+    parser.add_argument("--profile-out", type=Path, default=None, help="cProfileの結果（pstats形式）を保存するパス（--profile を含み、逐次処理になる）")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わず全画像を再処理")
     parser.add_argument("--info", type=Path, help="指定した画像の情報を表示して終了")
     
     args = parser.parse_args()
@@ -426,6 +3265,65 @@ JSON設定ファイル形式:
         print(f"モード: {info['mode']}")
         return 0
 
+    widths = None
+    if args.widths:
+        try:
+            widths = parse_widths(args.widths)
+        except ValueError as e:
+            print(f"エラー: {e}")
+            return 1
+
+    formats = None
+    if args.formats:
+        try:
+            formats = parse_formats(args.formats)
+        except ValueError as e:
+            print(f"エラー: {e}")
+            return 1
+
+    if args.min_ssim is not None:
+        if not NUMPY_AVAILABLE:
+            print("エラー: --min-ssim にはNumPyが必要です")
+            print("  pip install numpy")
+            return 1
+        if not 0 < args.min_ssim <= 1:
+            print("エラー: --min-ssim は 0 より大きく 1 以下で指定してください")
+            return 1
+        if args.target_kb:
+            print("エラー: --min-ssim と --target-kb は同時に指定できません")
+            return 1
+
+    if args.similar is not None:
+        if not 0 <= args.similar <= HASH_SIZE * HASH_SIZE:
+            print(f"エラー: --similar は 0 以上 {HASH_SIZE * HASH_SIZE} 以下で指定してください")
+            return 1
+        if args.similar_hash == "phash" and not NUMPY_AVAILABLE:
+            print("エラー: --similar-hash phash にはNumPyが必要です")
+            print("  pip install numpy")
+            return 1
+
+    if args.debounce < 0:
+        print("エラー: --debounce は 0 以上で指定してください")
+        return 1
+
+    if args.memory_mb is not None and args.memory_mb <= 0:
+        print("エラー: --memory-mb は 1 以上で指定してください")
+        return 1
+
+    if args.png_tolerance < 0:
+        print("エラー: --png-tolerance は 0 以上で指定してください")
+        return 1
+
+    png_tolerance = args.png_tolerance if args.png_optimize else None
+
+    if args.pipeline_mb <= 0:
+        print("エラー: --pipeline-mb は 1 以上で指定してください")
+        return 1
+
+    if args.reducing_gap and args.reducing_gap < 1:
+        print("エラー: --reducing-gap は 1.0 以上を指定してください")
+        return 1
+
     # 必須引数チェック
     if not args.input or not args.output:
         print("エラー: --input と --output は必須です")
@@ -441,41 +3339,146 @@ JSON設定ファイル形式:
         print(f"エラー: 入力パスがディレクトリではありません: {args.input}")
         return 1
 
+    # JSON Lines 出力時は標準出力をJSONだけにするため、見出しは標準エラー出力へ
+    header = sys.stderr if args.json_lines else sys.stdout
+
+    profile = args.profile or args.profile_out is not None
+    profiler = None
+    if args.profile_out:
+        # cProfile は実行中のプロセスしか計測できないため、ワーカーを使わない
+        if args.jobs != 1:
+            print("注意: --profile-out 指定時は逐次処理（--jobs 1）で実行します", file=header)
+            args.jobs = 1
+        profiler = cProfile.Profile()
+
+    if args.watch and profiler:
+        print("エラー: --watch と --profile-out は同時に指定できません")
+        return 1
+
+    if args.pipeline and profiler:
+        # パイプラインは変換を常にワーカープロセスで行うため、cProfile では計測できない
+        print("エラー: --pipeline と --profile-out は同時に指定できません")
+        return 1
+
+    pipeline_mb = args.pipeline_mb if args.pipeline else None
+
+    # --watch で使い回すプロセスプール（起動後に作る）
+    executor = None
+
     # JSON設定ファイルモード
     if args.config:
         if not args.config.exists():
             print(f"エラー: 設定ファイルが見つかりません: {args.config}")
             return 1
 
-        print(f"設定ファイル: {args.config}")
-        print(f"入力: {args.input}")
-        print(f"出力: {args.output}")
-        print("-" * 40)
+        print(f"設定ファイル: {args.config}", file=header)
+        print(f"入力: {args.input}", file=header)
+        print(f"出力: {args.output}", file=header)
+        print(f"並列数: {args.jobs}", file=header)
+        if pipeline_mb:
+            print(f"パイプライン: 先読み {pipeline_mb}MB まで", file=header)
+        print("-" * 40, file=header)
 
-        results = process_config_file(args.config, args.input, args.output)
-        print_results(results)
-        return 0
+        def run(paths: Optional[list[Path]] = None) -> Iterator[dict]:
+            return process_config_file(
+                args.config,
+                args.input,
+                args.output,
+                jobs=args.jobs,
+                use_cache=not args.no_cache,
+                reducing_gap=args.reducing_gap or None,
+                widths=widths,
+                formats=formats,
+                target_kb=args.target_kb,
+                min_ssim=args.min_ssim,
+                preview=args.preview,
+                memory_mb=args.memory_mb,
+                fingerprint=args.fingerprint,
+                dedupe=args.dedupe,
+                similar=args.similar,
+                similar_hash=args.similar_hash,
+                profile=profile,
+                paths=paths,
+                executor=executor,
+                pipeline_mb=pipeline_mb,
+                png_tolerance=png_tolerance
+            )
 
     # 通常モード（ディレクトリ一括処理）
-    print(f"入力: {args.input}")
-    print(f"出力: {args.output}")
-    print(f"最大サイズ: {args.max_width or '制限なし'} x {args.max_height or '制限なし'}")
-    print(f"WebP変換: {'しない' if args.keep_format else 'する'}")
-    print(f"品質: {args.quality}")
-    print("-" * 40)
-
-    results = process_directory(
-        args.input,
-        args.output,
-        max_width=args.max_width,
-        max_height=args.max_height,
-        convert_to_webp=not args.keep_format,
-        quality=args.quality,
-        recursive=not args.no_recursive,
-        flatten=args.flatten
-    )
+    else:
+        print(f"入力: {args.input}", file=header)
+        print(f"出力: {args.output}", file=header)
+        print(f"最大サイズ: {args.max_width or '制限なし'} x {args.max_height or '制限なし'}", file=header)
+        if formats:
+            print(f"出力形式: {', '.join(formats)}", file=header)
+        else:
+            print(f"WebP変換: {'しない' if args.keep_format else 'する'}", file=header)
+        if args.min_ssim:
+            print(f"品質: {args.quality}以下でSSIM {args.min_ssim} 以上", file=header)
+        elif args.target_kb:
+            print(f"品質: {args.quality}以下で目標 {args.target_kb}KB", file=header)
+        else:
+            print(f"品質: {args.quality}", file=header)
+        if widths:
+            print(f"srcset: {', '.join(str(width) for width in widths)}w", file=header)
+        print(f"並列数: {args.jobs}", file=header)
+        if pipeline_mb:
+            print(f"パイプライン: 先読み {pipeline_mb}MB まで", file=header)
+        print("-" * 40, file=header)
+
+        def run(paths: Optional[list[Path]] = None) -> Iterator[dict]:
+            return process_directory(
+                args.input,
+                args.output,
+                max_width=args.max_width,
+                max_height=args.max_height,
+                convert_to_webp=not args.keep_format,
+                quality=args.quality,
+                recursive=not args.no_recursive,
+                flatten=args.flatten,
+                jobs=args.jobs,
+                use_cache=not args.no_cache,
+                reducing_gap=args.reducing_gap or None,
+                widths=widths,
+                formats=formats,
+                target_kb=args.target_kb,
+                min_ssim=args.min_ssim,
+                ignore=DEFAULT_IGNORE_PATTERNS + tuple(args.ignore),
+                sort=not args.no_sort,
+                preview=args.preview,
+                memory_mb=args.memory_mb,
+                fingerprint=args.fingerprint,
+                dedupe=args.dedupe,
+                similar=args.similar,
+                similar_hash=args.similar_hash,
+                profile=profile,
+                paths=paths,
+                executor=executor,
+                pipeline_mb=pipeline_mb,
+                png_tolerance=png_tolerance
+            )
+
+    if args.watch:
+        if args.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_watch_worker)
+            warm_up(executor, args.jobs)
+        with executor or nullcontext():
+            try:
+                watch(
+                    run,
+                    args.input,
+                    args.output,
+                    recursive=not args.no_recursive,
+                    ignore=DEFAULT_IGNORE_PATTERNS + tuple(args.ignore),
+                    debounce=args.debounce,
+                    poll=args.poll,
+                    json_lines=args.json_lines
+                )
+            except KeyboardInterrupt:
+                print("\n監視を終了しました", file=header)
+        return 0
 
-    print_results(results)
+    run_results(run(), args.json_lines, profiler, args.profile_out)
 
     return 0
 
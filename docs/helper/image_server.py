@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+画像変換サーバー（ローカル・ステージング用）
+
+用途: ディレクトリ内の画像を、リクエストに応じたサイズ・形式に変換して配信
+- GET /<パス>?w=<最大幅>&q=<品質>&fmt=<形式> で変換結果を返す（変換は image_processor.transform_image）
+- 変換結果はメモリとディスクの2段のLRUキャッシュに保存（それぞれ上限バイト数を超えたら古いものから削除）
+- 同じ変換への同時リクエストは1回だけ変換し、結果を共有
+- ETag（元画像の更新日時・サイズと変換パラメータから計算）と If-None-Match による 304 に対応
+
+使用例:
+    # ./images を配信（http://127.0.0.1:8400/hero.jpg?w=800&fmt=webp）
+    python image_server.py --root ./images
+
+    # キャッシュの上限を指定（メモリ 256MB、ディスク 2GB）
+    python image_server.py --root ./images --memory-mb 256 --disk-cache ./.image_cache --disk-mb 2048
+"""
+
+import argparse
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from image_processor import (
+    COPY_EXTENSIONS,
+    FORMAT_EXTENSIONS,
+    IMAGE_EXTENSIONS,
+    PIL_AVAILABLE,
+    _init_watch_worker,
+    normalize_format,
+    transform_image,
+    warm_up,
+)
+
+DEFAULT_PORT = 8400
+DEFAULT_QUALITY = 85
+DEFAULT_FORMAT = "webp"
+# 指定できる最大幅（これより大きい w はエラー）
+MAX_WIDTH = 4000
+# キャッシュの上限（MB）
+DEFAULT_MEMORY_MB = 128
+DEFAULT_DISK_MB = 1024
+# 出力形式ごとの Content-Type
+FORMAT_MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+# ステージングでは元画像が差し替わるため、ブラウザには毎回 ETag で確認させる
+CACHE_CONTROL = "no-cache"
+
+
+class ResultCache:
+    """
+    変換結果のLRUキャッシュ（メモリとディスクの2段）
+
+    メモリにないものはディスクから読み、メモリに戻す。どちらも上限バイト数を超えたら
+    最も長く使われていないものから削除する。メモリの上限より大きい結果はディスクにだけ置く。
+    ディスクのキャッシュは再起動後も使う（起動時に更新日時の古い順に並べる）。
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[Path] = None, disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_used = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "evictions": 0}
+
+        if disk_dir:
+            disk_dir.mkdir(parents=True, exist_ok=True)
+            # 書き込み途中で止まった一時ファイルは使わない
+            entries = sorted(
+                (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                for entry in os.scandir(disk_dir)
+                if entry.is_file() and not entry.name.endswith(".tmp")
+            )
+            for _, name, size in entries:
+                self._disk[name] = size
+                self._disk_used += size
+            self._evict_disk()
+
+    def get(self, key: str) -> tuple[Optional[bytes], Optional[str]]:
+        """
+        キャッシュから取得
+
+        Returns:
+            (データ, "memory" または "disk")（ない場合は (None, None)）
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data, "memory"
+            on_disk = key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+
+        if on_disk:
+            try:
+                data = (self.disk_dir / key).read_bytes()
+            except FileNotFoundError:
+                # 別のスレッドが削除した直後
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._put_memory(key, data)
+                return data, "disk"
+
+        return None, None
+
+    def put(self, key: str, data: bytes) -> None:
+        """変換結果を両方の段に保存"""
+        if self.disk_dir and len(data) <= self.disk_bytes:
+            path = self.disk_dir / key
+            temp = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+            temp.write_bytes(data)
+            os.replace(temp, path)
+            with self._lock:
+                self._disk_used += len(data) - self._disk.pop(key, 0)
+                self._disk[key] = len(data)
+                self._evict_disk()
+
+        with self._lock:
+            self._put_memory(key, data)
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous)
+        self._memory[key] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self) -> None:
+        while self._disk_used > self.disk_bytes:
+            name, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self.disk_dir / name)
+            except FileNotFoundError:
+                pass
+
+    def usage(self) -> dict:
+        """使用量（バイト数・件数）と統計"""
+        with self._lock:
+            return {
+                **self.stats,
+                "memory_bytes": self._memory_used,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_used,
+                "disk_entries": len(self._disk),
+            }
+
+
+def parse_params(query: str) -> dict:
+    """
+    クエリ文字列から変換パラメータを取得（例: "w=800&q=80&fmt=avif"）
+
+    Raises:
+        ValueError: 値が不正な場合
+    """
+    values = {key: items[-1] for key, items in parse_qs(query).items()}
+    params = {"w": None, "q": DEFAULT_QUALITY, "fmt": DEFAULT_FORMAT}
+
+    if values.get("w"):
+        params["w"] = int(values["w"])
+        if not 1 <= params["w"] <= MAX_WIDTH:
+            raise ValueError(f"w は 1〜{MAX_WIDTH} で指定してください")
+    if values.get("q"):
+        params["q"] = int(values["q"])
+        if not 1 <= params["q"] <= 100:
+            raise ValueError("q は 1〜100 で指定してください")
+    if values.get("fmt"):
+        params["fmt"] = normalize_format(values["fmt"])
+
+    return params
+
+
+def cache_key(path: Path, stat: os.stat_result, params: dict) -> str:
+    """
+    元画像と変換パラメータからキャッシュキーを作る（ETag・ディスクキャッシュのファイル名にも使う）
+
+    元画像の更新日時・サイズを含めるため、差し替えた画像は別のキーになり、古い結果はLRUで消える。
+    """
+    source = f"{path}|{stat.st_mtime_ns}|{stat.st_size}|{params['w']}|{params['q']}|{params['fmt']}"
+    return hashlib.sha256(source.encode()).hexdigest()[:32]
+
+
+def render(path: Path, params: dict) -> bytes:
+    """画像を変換してエンコード結果を返す（ワーカープロセスで実行）"""
+    return transform_image(
+        path,
+        FORMAT_EXTENSIONS[params["fmt"]],
+        max_width=params["w"],
+        quality=params["q"]
+    )["data"]
+
+
+class ImageServer(ThreadingHTTPServer):
+    """変換結果のキャッシュと、同じ変換への同時リクエストの合流を持つHTTPサーバー"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        root: Path,
+        cache: ResultCache,
+        executor: ProcessPoolExecutor,
+        quiet: bool = False
+    ):
+        super().__init__(address, ImageRequestHandler)
+        self.root = root.resolve()
+        self.cache = cache
+        self.executor = executor
+        self.quiet = quiet
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"misses": 0, "coalesced": 0}
+
+    def transform(self, key: str, path: Path, params: dict) -> tuple[bytes, str]:
+        """
+        キャッシュから取得し、なければ変換する
+
+        同じキーを変換中のリクエストがあれば、その結果を待って共有する。
+
+        Returns:
+            (データ, キャッシュの状態 "memory"・"disk"・"miss"・"coalesced")
+        """
+        data, tier = self.cache.get(key)
+        if data is not None:
+            return data, tier
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                # 確認してからここまでの間に、変換中だったものが終わってキャッシュに入っていることがある
+                data, tier = self.cache.get(key)
+                if data is not None:
+                    return data, tier
+                future = self._inflight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            return future.result(), "coalesced"
+
+        try:
+            data = self.executor.submit(render, path, params).result()
+            self.cache.put(key, data)
+            future.set_result(data)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+        return data, "miss"
+
+    def usage(self) -> dict:
+        """キャッシュの使用量と統計"""
+        with self._lock:
+            return {**self.cache.usage(), **self.stats}
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """GET /<パス>?w=&q=&fmt= を処理"""
+
+    server: ImageServer
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        path = (self.server.root / unquote(url.path).lstrip("/")).resolve()
+
+        # ルートの外を指すパスは存在しないものとして扱う
+        if not path.is_relative_to(self.server.root) or not path.is_file():
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        suffix = path.suffix.lower()
+        if suffix in COPY_EXTENSIONS:
+            self.send_file(path, send_body)
+            return
+        if suffix not in IMAGE_EXTENSIONS:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        try:
+            params = parse_params(url.query)
+        except ValueError as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, explain=str(e))
+            return
+
+        key = cache_key(path, path.stat(), params)
+        etag = f'"{key}"'
+        if_none_match = {tag.strip().removeprefix("W/") for tag in self.headers.get("If-None-Match", "").split(",")}
+        if etag in if_none_match or "*" in if_none_match:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.send_header("X-Cache", "revalidated")
+            self.end_headers()
+            return
+
+        try:
+            data, tier = self.server.transform(key, path, params)
+        except Exception as e:
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, explain=f"変換に失敗しました: {e}")
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", FORMAT_MIME_TYPES[params["fmt"]])
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", CACHE_CONTROL)
+        self.send_header("X-Cache", tier)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def send_file(self, path: Path, send_body: bool) -> None:
+        """変換しない形式（SVGなど）をそのまま返す"""
+        data = path.read_bytes()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", CACHE_CONTROL)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def create_server(
+    root: Path,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    jobs: Optional[int] = None,
+    memory_mb: int = DEFAULT_MEMORY_MB,
+    disk_cache: Optional[Path] = None,
+    disk_mb: int = DEFAULT_DISK_MB,
+    quiet: bool = False
+) -> ImageServer:
+    """
+    サーバーを作成（変換用のワーカープロセスも起動する）
+
+    port に 0 を指定すると空いているポートを使う（server.server_address で確認）。
+    終了時は server.server_close() と server.executor.shutdown() を呼ぶ。
+    """
+    jobs = jobs or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_watch_worker)
+    warm_up(executor, jobs)
+    cache = ResultCache(memory_mb * 1024 * 1024, disk_cache, disk_mb * 1024 * 1024)
+    return ImageServer((host, port), root, cache, executor, quiet)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="画像をリクエストに応じたサイズ・形式に変換して配信するローカルサーバー",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # ./images を配信
+  python image_server.py --root ./images
+
+  # 変換して取得（最大幅800px、品質80、AVIF）
+  curl "http://127.0.0.1:8400/hero.jpg?w=800&q=80&fmt=avif" -o hero.avif
+
+  # キャッシュの上限とディスクキャッシュの場所を指定
+  python image_server.py --root ./images --memory-mb 256 --disk-cache ./.image_cache --disk-mb 2048
+        """
+    )
+    parser.add_argument("--root", "-r", type=Path, required=True, help="配信する画像のディレクトリ")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="待ち受けるアドレス（デフォルト: 127.0.0.1）")
+    parser.add_argument("--port", "-p", type=int, default=DEFAULT_PORT, help=f"ポート番号（デフォルト: {DEFAULT_PORT}）")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="変換の並列数（デフォルト: CPUコア数）")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_MB, help=f"メモリキャッシュの上限（MB、デフォルト: {DEFAULT_MEMORY_MB}）")
+    parser.add_argument("--disk-cache", type=Path, help="ディスクキャッシュのディレクトリ（省略時はメモリのみ）")
+    parser.add_argument("--disk-mb", type=int, default=DEFAULT_DISK_MB, help=f"ディスクキャッシュの上限（MB、デフォルト: {DEFAULT_DISK_MB}）")
+    parser.add_argument("--quiet", action="store_true", help="リクエストごとのログを表示しない")
+
+    args = parser.parse_args()
+
+    if not PIL_AVAILABLE:
+        print("エラー: Pillowがインストールされていません")
+        print("  pip install Pillow")
+        return 1
+
+    if not args.root.is_dir():
+        print(f"エラー: ディレクトリが見つかりません: {args.root}")
+        return 1
+
+    if args.jobs is not None and args.jobs < 1:
+        print("エラー: --jobs は 1 以上で指定してください")
+        return 1
+
+    if args.memory_mb < 0 or args.disk_mb < 0:
+        print("エラー: --memory-mb・--disk-mb は 0 以上で指定してください")
+        return 1
+
+    server = create_server(
+        args.root,
+        args.host,
+        args.port,
+        args.jobs,
+        args.memory_mb,
+        args.disk_cache,
+        args.disk_mb,
+        args.quiet
+    )
+    host, port = server.server_address[:2]
+    print(f"配信中: http://{host}:{port}/ （{args.root}、Ctrl+C で終了）")
+
+    start = time.monotonic()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown(cancel_futures=True)
+
+    usage = server.usage()
+    print(
+        f"\n終了: {time.monotonic() - start:.0f}秒、メモリヒット {usage['memory_hits']}件、"
+        f"ディスクヒット {usage['disk_hits']}件、変換 {usage['misses']}件、合流 {usage['coalesced']}件"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -3,7 +3,7 @@
 プレースホルダー画像生成スクリプト
 
 用途: HP制作時の仮画像を一括生成
-出力形式: WebP（推奨）、PNG、SVG
+出力形式: WebP（推奨）、PNG、SVG、data URI のバンドル（.ts / .js / .json）
 
 使用例:
     # JSONファイルから生成
@@ -14,12 +14,22 @@
 
     # 複数画像を一括生成
     python placeholder_generator.py --batch "hero:600x400,menu-1:300x300,gallery-1:400x300" --output ./images
+
+    # SVGの data URI を1つのモジュールにまとめる
+    python placeholder_generator.py --config images.json --bundle ./src/placeholders.ts
 """
 
 import argparse
+import gzip
+import html
 import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+from urllib.parse import quote
 
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -27,61 +37,90 @@ try:
 except ImportError:
     PIL_AVAILABLE = False
 
-
-def get_font(size: int = 24) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
-    """利用可能なフォントを取得（日本語対応フォント優先）"""
-    font_paths = [
-        # Windows日本語フォント
-        "C:/Windows/Fonts/meiryo.ttc",
-        "C:/Windows/Fonts/YuGothM.ttc",
-        "C:/Windows/Fonts/msgothic.ttc",
-        # 英字フォント（フォールバック）
-        "C:/Windows/Fonts/arial.ttf",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
-        "/System/Library/Fonts/Helvetica.ttc",
-    ]
-    
-    for font_path in font_paths:
+# フォントの候補（先頭から順に、最初に読み込めたものを使う）
+FONT_PATHS = (
+    # Windows日本語フォント
+    "C:/Windows/Fonts/meiryo.ttc",
+    "C:/Windows/Fonts/YuGothM.ttc",
+    "C:/Windows/Fonts/msgothic.ttc",
+    # 英字フォント（フォールバック）
+    "C:/Windows/Fonts/arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+)
+# 読み込んだフォントをサイズごとに保持する数
+FONT_CACHE_SIZE = 32
+# 描画済みのベース画像を保持する数（1920x1080 で約6MB/枚）
+BASE_CACHE_SIZE = 16
+BORDER_COLOR = "#AAAAAA"
+# プレビューSVGのぼかしの強さ（長辺に対する割合）
+PREVIEW_BLUR_RATIO = 0.04
+
+# --font で指定したフォント（None なら FONT_PATHS から自動選択）
+_font_path: Optional[str] = None
+# ファイル名によらず同じ内容になる出力の、最初に生成したファイル
+_identical_outputs: dict[tuple, Path] = {}
+
+
+@lru_cache(maxsize=1)
+def find_font_path() -> Optional[str]:
+    """FONT_PATHS から最初に読み込めるフォントを探す（プロセスごとに1回だけ探す）"""
+    for font_path in FONT_PATHS:
         try:
-            return ImageFont.truetype(font_path, size)
+            ImageFont.truetype(font_path, 12)
+            return font_path
         except (IOError, OSError):
             continue
     
+    return None
+
+
+def set_font(font_path: Optional[str | Path]) -> None:
+    """
+    使用するフォントを指定（None なら FONT_PATHS から自動選択）
+
+    Raises:
+        OSError: フォントを読み込めない場合
+    """
+    global _font_path
+    
+    if font_path:
+        ImageFont.truetype(str(font_path), 12)
+    
+    _font_path = str(font_path) if font_path else None
+    get_font.cache_clear()
+    render_base.cache_clear()
+    _identical_outputs.clear()
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(size: int = 24) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+    """利用可能なフォントを取得（日本語対応フォント優先、サイズごとにキャッシュ）"""
+    font_path = _font_path or find_font_path()
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    
     return ImageFont.load_default()
 
 
-def generate_placeholder_image(
+@lru_cache(maxsize=BASE_CACHE_SIZE)
+def render_base(
     width: int,
     height: int,
-    output_path: Path,
-    bg_color: str = "#CCCCCC",
-    text_color: str = "#666666",
-    show_filename: bool = True,
-    custom_text: str = None
-) -> bool:
+    bg_color: str,
+    text_color: str,
+    show_filename: bool
+) -> tuple[Image.Image, int, int]:
     """
-    プレースホルダー画像を生成
-    
-    Args:
-        width: 画像幅
-        height: 画像高さ
-        output_path: 出力ファイルパス
-        bg_color: 背景色（hex）
-        text_color: テキスト色（hex）
-        show_filename: ファイル名を表示するか
-        custom_text: カスタムテキスト（指定時はファイル名の代わりに表示）
+    背景・サイズ表示・枠線を描画したベース画像を作成（同じサイズ・色では1回だけ描画）
+
+    返す画像は共有されるため、描き込む場合は copy() すること。
 
     Returns:
-        成功したかどうか
+        (ベース画像, フォントサイズ, ファイル名を描画する y 座標)
     """
-    if not PIL_AVAILABLE:
-        print("エラー: Pillowがインストールされていません")
-        print("  pip install Pillow --break-system-packages")
-        return False
-    
-    # 画像作成
     img = Image.new("RGB", (width, height), bg_color)
     draw = ImageDraw.Draw(img)
     
@@ -107,6 +146,82 @@ def generate_placeholder_image(
     
     draw.text((x, y), size_text, fill=text_color, font=font)
     
+    # 枠線（オプション）
+    draw.rectangle([0, 0, width - 1, height - 1], outline=BORDER_COLOR, width=2)
+    
+    return img, font_size, y + text_height + 10
+
+
+def link_or_copy(source: Path, target: Path, hardlink: bool = False) -> None:
+    """source と同じ内容のファイルを target に作成（hardlink 指定時はハードリンク、できなければコピー）"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    
+    if hardlink:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            # 別ドライブやハードリンク非対応のファイルシステムではコピーする
+            pass
+    
+    shutil.copyfile(source, target)
+
+
+def generate_placeholder_image(
+    width: int,
+    height: int,
+    output_path: Path,
+    bg_color: str = "#CCCCCC",
+    text_color: str = "#666666",
+    show_filename: bool = True,
+    custom_text: str = None,
+    hardlink: bool = False
+) -> bool:
+    """
+    プレースホルダー画像を生成
+    
+    背景・サイズ表示・枠線はサイズと色ごとに1回だけ描画し（render_base）、ファイル名だけを描き足す。
+    custom_text 指定時など内容がファイル名によらない場合は、同じ内容で生成済みのファイルをコピーする。
+    
+    Args:
+        width: 画像幅
+        height: 画像高さ
+        output_path: 出力ファイルパス
+        bg_color: 背景色（hex）
+        text_color: テキスト色（hex）
+        show_filename: ファイル名を表示するか
+        custom_text: カスタムテキスト（指定時はファイル名の代わりに表示）
+        hardlink: 同じ内容のファイルをコピーの代わりにハードリンクで作成するか
+
+    Returns:
+        成功したかどうか
+    """
+    if not PIL_AVAILABLE:
+        print("エラー: Pillowがインストールされていません")
+        print("  pip install Pillow --break-system-packages")
+        return False
+    
+    suffix = output_path.suffix.lower()
+    if suffix not in (".webp", ".png", ".jpg", ".jpeg"):
+        # デフォルトはWebP
+        output_path = output_path.with_suffix(".webp")
+        suffix = ".webp"
+    
+    # ファイル名を表示しない場合は、同じ内容で生成済みのファイルを使い回す
+    identical_key = None
+    if custom_text or not show_filename:
+        identical_key = (width, height, bg_color, text_color, show_filename, custom_text, suffix)
+        source = _identical_outputs.get(identical_key)
+        if source and source != output_path and source.exists():
+            link_or_copy(source, output_path, hardlink)
+            return True
+    
+    base, font_size, fn_y = render_base(width, height, bg_color, text_color, show_filename)
+    img = base.copy()
+    draw = ImageDraw.Draw(img)
+    
     # ファイル名またはカスタムテキスト表示
     if show_filename or custom_text:
         display_text = custom_text if custom_text else output_path.name
@@ -114,31 +229,55 @@ def generate_placeholder_image(
         bbox = draw.textbbox((0, 0), display_text, font=small_font)
         fn_width = bbox[2] - bbox[0]
         fn_x = (width - fn_width) // 2
-        fn_y = y + text_height + 10
         draw.text((fn_x, fn_y), display_text, fill=text_color, font=small_font)
+        # 長いテキストが枠線に重なっても枠線を上にする
+        draw.rectangle([0, 0, width - 1, height - 1], outline=BORDER_COLOR, width=2)
     
-    # 枠線（オプション）
-    border_color = "#AAAAAA"
-    draw.rectangle([0, 0, width - 1, height - 1], outline=border_color, width=2)
-    
-    # 保存
+    # 保存（ハードリンクされたファイルは他のファイルまで書き換えないよう切り離す）
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.exists() and output_path.stat().st_nlink > 1:
+        output_path.unlink()
     
-    suffix = output_path.suffix.lower()
     if suffix == ".webp":
         img.save(output_path, "WEBP", quality=80)
     elif suffix == ".png":
         img.save(output_path, "PNG")
-    elif suffix in [".jpg", ".jpeg"]:
-        img.save(output_path, "JPEG", quality=85)
     else:
-        # デフォルトはWebP
-        output_path = output_path.with_suffix(".webp")
-        img.save(output_path, "WEBP", quality=80)
+        img.save(output_path, "JPEG", quality=85)
+    
+    if identical_key:
+        _identical_outputs[identical_key] = output_path
     
     return True
 
 
+def render_svg_placeholder(
+    width: int,
+    height: int,
+    bg_color: str = "#CCCCCC",
+    text_color: str = "#666666",
+    label: Optional[str] = None
+) -> str:
+    """
+    SVG形式のプレースホルダーを1行の文字列で作成
+
+    サイズを中央に表示し、label があればその下に表示する。
+    """
+    label_text = (
+        f'<text x="50%" y="60%" dominant-baseline="middle" text-anchor="middle" font-family="sans-serif" '
+        f'font-size="{min(width, height) // 16}" fill="{text_color}">{html.escape(label, quote=False)}</text>'
+        if label else ""
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="{bg_color}"/>'
+        f'<rect x="1" y="1" width="{width-2}" height="{height-2}" fill="none" stroke="{BORDER_COLOR}" stroke-width="2"/>'
+        f'<text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" font-family="sans-serif" '
+        f'font-size="{min(width, height) // 8}" fill="{text_color}">{width} × {height}</text>'
+        f'{label_text}</svg>'
+    )
+
+
 def generate_svg_placeholder(
     width: int,
     height: int,
@@ -146,27 +285,170 @@ def generate_svg_placeholder(
     bg_color: str = "#CCCCCC",
     text_color: str = "#666666"
 ) -> bool:
-    """SVG形式のプレースホルダーを生成"""
-    
-    svg_content = f'''<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
-  <rect width="100%" height="100%" fill="{bg_color}"/>
-  <rect x="1" y="1" width="{width-2}" height="{height-2}" fill="none" stroke="#AAAAAA" stroke-width="2"/>
-  <text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" font-family="sans-serif" font-size="{min(width, height) // 8}" fill="{text_color}">{width} × {height}</text>
-  <text x="50%" y="60%" dominant-baseline="middle" text-anchor="middle" font-family="sans-serif" font-size="{min(width, height) // 16}" fill="{text_color}">{output_path.name}</text>
-</svg>'''
+    """SVG形式のプレースホルダーを生成（ファイル名を表示）"""
+    svg_content = render_svg_placeholder(width, height, bg_color, text_color, output_path.name)
     
     output_path.parent.mkdir(parents=True, exist_ok=True)
     output_path.write_text(svg_content, encoding="utf-8")
     return True
 
 
+def svg_data_uri(svg: str) -> str:
+    """
+    SVGを data URI にする
+
+    base64 より短くなるよう、属性の " を ' に置き換え、URIで意味を持つ文字だけをエスケープする。
+    """
+    return "data:image/svg+xml," + quote(svg.replace('"', "'"), safe=" '=:/;,()-.")
+
+
+def bundle_entries(entries: list[dict | str], output_dir: Path) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    項目のSVGプレースホルダーを data URI にし、サイズ・色・テキストが同じものをまとめる
+
+    バンドルではファイル名を表示しないため、同じサイズ・色の項目は同じ data URI になる。
+
+    Args:
+        entries: generate_placeholder の引数（dict）、またはスキップした項目のメッセージ（str）
+        output_dir: 出力名の基準にするディレクトリ（出力名は output_dir からの相対パス）
+
+    Returns:
+        (キー → data URI, 出力名 → キー)。キーは "600x400"（同じサイズで内容が違うものは "600x400-2" ...）
+
+    Raises:
+        ValueError: 出力名が重複する場合
+    """
+    uris: dict[str, str] = {}
+    keys: dict[tuple, str] = {}
+    names: dict[str, str] = {}
+    
+    for entry in entries:
+        if isinstance(entry, str):
+            continue
+        
+        content = (
+            entry["width"],
+            entry["height"],
+            entry.get("bg_color", "#CCCCCC"),
+            entry.get("text_color", "#666666"),
+            entry.get("custom_text"),
+        )
+        if content not in keys:
+            key = f"{entry['width']}x{entry['height']}"
+            if key in uris:
+                key = f"{key}-{sum(existing.split('-')[0] == key for existing in uris) + 1}"
+            keys[content] = key
+            uris[key] = svg_data_uri(render_svg_placeholder(*content))
+        name = entry["output_path"].relative_to(output_dir).as_posix()
+        if name in names:
+            raise ValueError(f"出力名が重複しています: {name}")
+        names[name] = keys[content]
+    
+    return uris, names
+
+
+def write_bundle(entries: list[dict | str], bundle_path: Path, output_dir: Path) -> int:
+    """
+    項目のSVGプレースホルダーを1つのJSONまたはTypeScriptモジュールにまとめて書き込み、サイズを表示
+
+    .json は {"uris": {キー: data URI}, "images": {出力名: キー}}、
+    .ts・.js は data URI を定数にし、出力名 → data URI のオブジェクトを export する。
+    出力名は output_dir からの相対パス（例: "hero.webp"、"menu/item-1.webp"）。
+
+    Returns:
+        バンドルに入れた項目の数
+
+    Raises:
+        ValueError: 出力名が重複する場合
+    """
+    uris, names = bundle_entries(entries, output_dir)
+    
+    if bundle_path.suffix.lower() == ".json":
+        content = json.dumps({"uris": uris, "images": names}, ensure_ascii=False, separators=(",", ":"))
+    else:
+        constants = {key: f"p{i}" for i, key in enumerate(uris)}
+        lines = ["// placeholder_generator.py --bundle で生成（編集しないでください）"]
+        lines += [f"const {constants[key]} = {json.dumps(uri)};" for key, uri in uris.items()]
+        lines.append("export const placeholders = {")
+        lines += [f"  {json.dumps(name)}: {constants[key]}," for name, key in names.items()]
+        lines.append("}" + (" as const;" if bundle_path.suffix.lower() == ".ts" else ";"))
+        lines.append("export default placeholders;")
+        content = "\n".join(lines) + "\n"
+    
+    for entry in entries:
+        if isinstance(entry, str):
+            print(entry)
+    
+    first_names = {}
+    for name, key in names.items():
+        if key in first_names:
+            print(f"= {name} → {key}（{first_names[key]} と共有）")
+        else:
+            first_names[key] = name
+            print(f"✓ {name} → {key}（{len(uris[key].encode())}B）")
+    
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    bundle_path.write_text(content, encoding="utf-8")
+    data = content.encode()
+    print(
+        f"\nバンドル: {bundle_path}（{len(names)}件、data URI {len(uris)}件、"
+        f"{len(data) / 1024:.1f}KB、gzip {len(gzip.compress(data)) / 1024:.1f}KB）"
+    )
+    return len(names)
+
+
+def generate_preview_svg(width: int, height: int, color: str, lqip: Optional[str] = None) -> str:
+    """
+    平均色の上にぼかしたLQIPを重ねたSVGを作成（image_processor.py --preview の出力から）
+
+    LQIPを data URI で埋め込むため、SVG単体で表示できる。
+    """
+    blur = round(max(width, height) * PREVIEW_BLUR_RATIO, 1)
+    image = (
+        f'<filter id="b" color-interpolation-filters="sRGB"><feGaussianBlur stdDeviation="{blur}"/></filter>'
+        f'<image width="100%" height="100%" preserveAspectRatio="none" filter="url(#b)" href="{lqip}"/>'
+        if lqip else ""
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="{color}"/>{image}</svg>'
+    )
+
+
+def process_preview_manifest(manifest_path: Path, output_dir: Path) -> int:
+    """
+    image_processor.py --preview のマニフェスト（placeholders.json）からプレビューSVGを生成
+
+    各エントリの出力名の拡張子を .svg にしたパスに書き込む（hero.webp → hero.svg）。
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    
+    success_count = 0
+    for name, preview in manifest.items():
+        output_path = (output_dir / name).with_suffix(".svg")
+        try:
+            svg = generate_preview_svg(preview["width"], preview["height"], preview["color"], preview.get("lqip"))
+        except KeyError as e:
+            print(f"✗ スキップ: {name} - {e} がありません")
+            continue
+        
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(svg, encoding="utf-8")
+        print(f"✓ 生成: {output_path}")
+        success_count += 1
+    
+    return success_count
+
+
 def generate_placeholder(
     width: int,
     height: int,
     output_path: Path,
     bg_color: str = "#CCCCCC",
     text_color: str = "#666666",
-    custom_text: str = None
+    custom_text: str = None,
+    hardlink: bool = False
 ) -> bool:
     """形式に応じてプレースホルダーを生成"""
 
@@ -175,7 +457,10 @@ def generate_placeholder(
     if suffix == ".svg":
         return generate_svg_placeholder(width, height, output_path, bg_color, text_color)
     else:
-        return generate_placeholder_image(width, height, output_path, bg_color, text_color, custom_text=custom_text)
+        return generate_placeholder_image(
+            width, height, output_path, bg_color, text_color,
+            custom_text=custom_text, hardlink=hardlink
+        )
 
 
 def parse_size(size_str: str) -> tuple[int, int]:
@@ -186,23 +471,56 @@ def parse_size(size_str: str) -> tuple[int, int]:
     return int(parts[0]), int(parts[1])
 
 
-def process_config_file(config_path: Path, output_dir: Path) -> int:
-    """JSONコンフィグファイルから画像を生成"""
-    
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = json.load(f)
+def _init_worker(font_path: Optional[str]) -> None:
+    """ワーカープロセスの初期化（メインプロセスと同じフォントを使う）"""
+    if font_path:
+        set_font(font_path)
+
+
+def _generate_task(task: dict) -> bool:
+    """ワーカープロセスで1件生成"""
+    return generate_placeholder(**task)
+
+
+def generate_tasks(tasks: list[dict], jobs: int = 1) -> Iterator[bool]:
+    """
+    generate_placeholder の引数のリストを順に生成し、成否を入力順に返すジェネレータ
+
+    jobs が2以上ならプロセスプールで並列に生成する。フォントはワーカーごとに読み込む。
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield generate_placeholder(**task)
+        return
     
-    images = config.get("images", config if isinstance(config, list) else [])
+    # 続けて並ぶ同じサイズの項目が同じワーカーに渡るよう、ある程度まとめて送る
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(_font_path,)) as executor:
+        yield from executor.map(_generate_task, tasks, chunksize=chunksize)
+
+
+def generate_entries(entries: list[dict | str], jobs: int = 1) -> int:
+    """
+    項目を生成して結果を入力順に表示
+
+    Args:
+        entries: generate_placeholder の引数（dict）、またはスキップした項目のメッセージ（str）
+        jobs: 並列数（1なら逐次処理）
+
+    Returns:
+        生成に成功した件数
+    """
+    tasks = [entry for entry in entries if isinstance(entry, dict)]
+    results = generate_tasks(tasks, jobs)
     
     success_count = 0
-    for item in images:
-        name = item.get("name", f"placeholder-{item['width']}x{item['height']}.webp")
-        width = item.get("width", 300)
-        height = item.get("height", 200)
-        
-        output_path = output_dir / name
+    for entry in entries:
+        if isinstance(entry, str):
+            print(entry)
+            continue
         
-        if generate_placeholder(width, height, output_path):
+        output_path = entry["output_path"]
+        if next(results):
             print(f"✓ 生成: {output_path}")
             success_count += 1
         else:
@@ -211,10 +529,61 @@ def process_config_file(config_path: Path, output_dir: Path) -> int:
     return success_count
 
 
-def process_batch(batch_str: str, output_dir: Path, ext: str = ".webp") -> int:
-    """バッチ文字列から画像を生成（例: "hero:600x400,menu:300x300"）"""
+def config_entries(
+    config_path: Path,
+    output_dir: Path,
+    custom_text: Optional[str] = None,
+    hardlink: bool = False
+) -> list[dict | str]:
+    """JSONコンフィグファイルから生成する項目を作成（各項目の "text" がなければ custom_text を表示）"""
     
-    success_count = 0
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    
+    images = config.get("images", config if isinstance(config, list) else [])
+    
+    entries = []
+    for item in images:
+        name = item.get("name", f"placeholder-{item['width']}x{item['height']}.webp")
+        width = item.get("width", 300)
+        height = item.get("height", 200)
+        
+        text = item.get("text", custom_text)
+        
+        output_path = output_dir / name
+        
+        entries.append({
+            "width": width,
+            "height": height,
+            "output_path": output_path,
+            "custom_text": text,
+            "hardlink": hardlink,
+        })
+    
+    return entries
+
+
+def process_config_file(
+    config_path: Path,
+    output_dir: Path,
+    custom_text: Optional[str] = None,
+    hardlink: bool = False,
+    jobs: int = 1
+) -> int:
+    """JSONコンフィグファイルから画像を生成（各項目の "text" がなければ custom_text を表示）"""
+    return generate_entries(config_entries(config_path, output_dir, custom_text, hardlink), jobs)
+
+
+def batch_entries(
+    batch_str: str,
+    output_dir: Path,
+    ext: str = ".webp",
+    custom_text: Optional[str] = None,
+    hardlink: bool = False
+) -> list[dict | str]:
+    """バッチ文字列から生成する項目を作成（例: "hero:600x400,menu:300x300"）"""
+    
+    entries = []
     items = batch_str.split(",")
     
     for item in items:
@@ -228,7 +597,7 @@ def process_batch(batch_str: str, output_dir: Path, ext: str = ".webp") -> int:
         try:
             width, height = parse_size(size)
         except ValueError as e:
-            print(f"✗ スキップ: {item} - {e}")
+            entries.append(f"✗ スキップ: {item} - {e}")
             continue
         
         # 拡張子がなければ追加
@@ -237,13 +606,27 @@ def process_batch(batch_str: str, output_dir: Path, ext: str = ".webp") -> int:
         
         output_path = output_dir / name
         
-        if generate_placeholder(width, height, output_path):
-            print(f"✓ 生成: {output_path}")
-            success_count += 1
-        else:
-            print(f"✗ 失敗: {output_path}")
-    
-    return success_count
+        entries.append({
+            "width": width,
+            "height": height,
+            "output_path": output_path,
+            "custom_text": custom_text,
+            "hardlink": hardlink,
+        })
+    
+    return entries
+
+
+def process_batch(
+    batch_str: str,
+    output_dir: Path,
+    ext: str = ".webp",
+    custom_text: Optional[str] = None,
+    hardlink: bool = False,
+    jobs: int = 1
+) -> int:
+    """バッチ文字列から画像を生成（例: "hero:600x400,menu:300x300"）"""
+    return generate_entries(batch_entries(batch_str, output_dir, ext, custom_text, hardlink), jobs)
 
 
 def main():
@@ -261,11 +644,26 @@ def main():
   # 複数画像を一括生成
   python placeholder_generator.py --batch "hero:600x400,menu-1:300x300" --output ./images
 
+  # 並列数を指定（1なら逐次処理）
+  python placeholder_generator.py --config images.json --output ./images --jobs 4
+
+  # image_processor.py --preview の placeholders.json から、ぼかしたLQIPのSVGを生成
+  python placeholder_generator.py --from-manifest ./images/placeholders.json --output ./images
+
+  # フォントを指定
+  python placeholder_generator.py --batch "hero:600x400" --font ./fonts/NotoSansJP-Regular.ttf
+
+  # 同じテキストを表示し、同じ内容の画像はハードリンクで作成
+  python placeholder_generator.py --batch "menu-1:300x300,menu-2:300x300" --text "Coming soon" --hardlink
+
+  # 画像ファイルの代わりに、SVGの data URI を1つのモジュールにまとめる（.ts / .js / .json）
+  python placeholder_generator.py --config images.json --bundle ./src/placeholders.ts
+
 JSONファイル形式:
   {
     "images": [
       {"name": "hero.webp", "width": 600, "height": 400},
-      {"name": "menu-1.webp", "width": 300, "height": 300}
+      {"name": "menu-1.webp", "width": 300, "height": 300, "text": "Coming soon"}
     ]
   }
         """
@@ -273,14 +671,64 @@ JSONファイル形式:
     
     parser.add_argument("--config", "-c", type=Path, help="JSONコンフィグファイル")
     parser.add_argument("--output", "-o", type=Path, default=Path("./images"), help="出力ディレクトリ")
+    parser.add_argument("--from-manifest", "-m", type=Path, help="image_processor.py --preview のマニフェスト（placeholders.json）からSVGを生成")
     parser.add_argument("--size", "-s", type=str, help="画像サイズ（例: 600x400）")
     parser.add_argument("--name", "-n", type=str, help="出力ファイル名")
     parser.add_argument("--batch", "-b", type=str, help="バッチ生成（例: hero:600x400,menu:300x300）")
     parser.add_argument("--ext", "-e", type=str, default=".webp", help="デフォルト拡張子")
-    parser.add_argument("--text", "-t", type=str, help="カスタムテキスト（画像に表示）")
+    parser.add_argument("--text", "-t", type=str, help="カスタムテキスト（ファイル名の代わりに画像に表示）")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="並列数（デフォルト: CPUコア数、1なら逐次処理）")
+    parser.add_argument("--font", type=Path, help="使用するフォントファイル（.ttf / .ttc / .otf、デフォルト: 自動選択）")
+    parser.add_argument("--hardlink", action="store_true", help="同じ内容になる画像をコピーの代わりにハードリンクで作成")
+    parser.add_argument("--bundle", type=Path, help="--config / --batch / --size の画像をファイルにせず、SVGの data URI を1つのモジュール（.ts / .js / .json）にまとめる（--hardlink・--from-manifest とは同時に指定できない）")
     
     args = parser.parse_args()
     
+    if args.bundle and (args.hardlink or args.from_manifest):
+        parser.error("--bundle は --hardlink・--from-manifest と同時に指定できません")
+    
+    if args.font:
+        try:
+            set_font(args.font)
+        except OSError as e:
+            print(f"エラー: フォントを読み込めません: {args.font} ({e})")
+            return 1
+    
+    # SVGの data URI を1つのモジュールにまとめる
+    if args.bundle:
+        if args.bundle.suffix.lower() not in (".ts", ".js", ".json"):
+            print(f"エラー: --bundle の拡張子は .ts / .js / .json のいずれかにしてください: {args.bundle}")
+            return 1
+        
+        entries = []
+        if args.config:
+            if not args.config.exists():
+                print(f"エラー: コンフィグファイルが見つかりません: {args.config}")
+                return 1
+            entries += config_entries(args.config, args.output, args.text)
+        if args.batch:
+            entries += batch_entries(args.batch, args.output, args.ext, args.text)
+        if args.size:
+            try:
+                width, height = parse_size(args.size)
+            except ValueError as e:
+                print(f"エラー: {e}")
+                return 1
+            name = args.name or f"placeholder-{width}x{height}{args.ext}"
+            entries.append({"width": width, "height": height, "output_path": args.output / name, "custom_text": args.text})
+        
+        if not entries:
+            print("エラー: --bundle には --config / --batch / --size のいずれかを指定してください")
+            return 1
+        
+        try:
+            total = write_bundle(entries, args.bundle, args.output)
+        except ValueError as e:
+            print(f"エラー: {e}")
+            return 1
+        print(f"合計: {total}件のプレースホルダーをまとめました")
+        return 0
+    
     # 出力ディレクトリ作成
     args.output.mkdir(parents=True, exist_ok=True)
     
@@ -291,11 +739,18 @@ JSONファイル形式:
         if not args.config.exists():
             print(f"エラー: コンフィグファイルが見つかりません: {args.config}")
             return 1
-        total += process_config_file(args.config, args.output)
+        total += process_config_file(args.config, args.output, args.text, args.hardlink, args.jobs)
+    
+    # プレビューマニフェストから生成
+    if args.from_manifest:
+        if not args.from_manifest.exists():
+            print(f"エラー: マニフェストが見つかりません: {args.from_manifest}")
+            return 1
+        total += process_preview_manifest(args.from_manifest, args.output)
     
     # バッチ生成
     if args.batch:
-        total += process_batch(args.batch, args.output, args.ext)
+        total += process_batch(args.batch, args.output, args.ext, args.text, args.hardlink, args.jobs)
     
     # 単一画像生成
     if args.size:
@@ -308,13 +763,13 @@ JSONファイル形式:
         name = args.name or f"placeholder-{width}x{height}{args.ext}"
         output_path = args.output / name
 
-        if generate_placeholder(width, height, output_path, custom_text=args.text):
+        if generate_placeholder(width, height, output_path, custom_text=args.text, hardlink=args.hardlink):
             print(f"✓ 生成: {output_path}")
             total += 1
         else:
             print(f"✗ 失敗: {output_path}")
     
-    if total == 0 and not (args.config or args.batch or args.size):
+    if total == 0 and not (args.config or args.from_manifest or args.batch or args.size):
         parser.print_help()
         return 1
     